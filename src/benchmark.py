@@ -0,0 +1,478 @@
+"""
+Benchmarks of the bot's per-turn work, run from the repository root, e.g.:
+
+    python src/benchmark.py search
+"""
+import argparse
+import contextlib
+import glob
+import heapq
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+import incremental_search
+import search
+import velocity_search
+from sensor import Sensor
+from state import *
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+# The judge modules import each other as top level modules, so ``judge`` means
+# judge.py for them, while the bot imports the judge directory as ``judge``.
+_judge_package = sys.modules.pop('judge')
+sys.path.append(os.path.join(SRC_DIR, 'judge'))
+import grid_race_env
+import network
+import run
+sys.modules['judge'] = _judge_package
+
+SAMPLE_BOT = os.path.join(
+    SRC_DIR, 'bot', 'lieutenant_crown_him_with_many_crowns_thy_full_gallant_'
+    'legions_he_found_it_in_him_to_forgive.py')
+MAPS = sorted(glob.glob(os.path.join(SRC_DIR, '..', 'res', 'maps', '*.png')))
+
+# Reference implementations {{{1 #
+# Copies of the planner as it was before the array-backed rewrite, kept to
+# check that the results did not change and to measure the speed-up.
+
+def reference_heuristic(x, y, grid, state: State, start):
+    priority = 0
+    Gx, Gy = state.to_global(x - start[0], y - start[1])
+    if state.is_visited(Gx, Gy):
+        priority -= 20
+    for dx, dy in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
+        nx, ny = x + dx, y + dy
+        if 0 <= nx < grid.shape[0] and 0 <= ny < grid.shape[1]:
+            gx, gy = state.to_global(nx - start[0], ny - start[1])
+            if state.is_visited(gx, gy):
+                priority -= 20
+            if grid[nx, ny] == NOT_VISIBLE:
+                priority += 1
+            elif grid[nx, ny] == EMPTY:
+                priority += 0.5
+    return priority
+
+def reference_a_star_search(grid, start, state: State):
+    pq = []
+    heapq.heappush(pq, (0, start))
+    came_from = {}
+    g_score = {start: 0}
+    max_f_score_node = (0, start)
+    f_map = {}
+
+    while pq:
+        current_f, (cx, cy) = heapq.heappop(pq)
+        if grid[cx, cy] == GOAL:
+            path = []
+            while (cx, cy) in came_from:
+                path.append((cx, cy))
+                cx, cy = came_from[(cx, cy)]
+            path.reverse()
+            return path, f_map
+        if max_f_score_node[0] == 0:
+            max_f_score_node = (current_f, (cx, cy))
+        if current_f > max_f_score_node[0]:
+            max_f_score_node = (current_f, (cx, cy))
+        for dx, dy in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
+            nx, ny = cx + dx, cy + dy
+            if search.is_valid_position(nx, ny, grid):
+                tentative_g_score = g_score[(cx, cy)] + 1
+                if ((nx, ny) not in g_score
+                        or tentative_g_score < g_score[(nx, ny)]):
+                    came_from[(nx, ny)] = (cx, cy)
+                    g_score[(nx, ny)] = tentative_g_score
+                    heur = reference_heuristic(nx, ny, grid, state, start)
+                    f_score = tentative_g_score + heur
+                    f_map[(nx, ny)] = f_score
+                    gx, gy = state.to_global(nx - start[0], ny - start[1])
+                    if state.is_visited(gx, gy):
+                        f_score -= 20 * tentative_g_score
+                    heapq.heappush(pq, (f_score, (nx, ny)))
+
+    path = []
+    if max_f_score_node[0] != 0:
+        cx, cy = max_f_score_node[1]
+        while (cx, cy) in came_from:
+            path.append((cx, cy))
+            cx, cy = came_from[(cx, cy)]
+        path.reverse()
+    return path, f_map
+
+def reference_sense(environment, input: str):
+    # the grid as a list of lists, converted to an array by the caller
+    lines = input.splitlines()
+    physics = [int(x) for x in lines[0].split()]
+    lines = lines[1:]
+    if environment.filtered_players:
+        num_of_players = int(lines[0])
+        lines = lines[1:]
+    else:
+        num_of_players = environment.num_of_players
+    players = [[int(x) for x in line.split()]
+               for line in lines[:num_of_players]]
+    lines = lines[num_of_players:]
+    grid = [[int(x) for x in line.split()]
+            for line in lines[:2 * environment.vis_radius + 1]]
+    return physics, players, np.array(grid)
+
+# 1}}} #
+
+# Scenarios {{{1 #
+class Scenario:
+    """
+    A bot's view of one turn: the observation the judge sends for a player
+    standing on ``pos``, with some of the cells around it already visited.
+    """
+
+    def __init__(self, env: run.GridRaceEnv, pos, rng: np.random.Generator):
+        env.circuit.players[0].pos[()] = pos
+        self.observation = env.observation(0)
+        self.sensor = Sensor(f'{env.circuit.shape[0]} {env.circuit.shape[1]} '
+                             f'1 {env.visibility_radius}')
+        self.sensor.Sense(self.observation)
+        self.state = State(self.sensor)
+        # a random walk leading to the current position
+        walk = np.array(pos)
+        for _ in range(int(rng.integers(0, 4 * env.visibility_radius))):
+            self.state.add_global(int(walk[0]), int(walk[1]))
+            walk = walk + rng.integers(-1, 2, size=2)
+        self.grid = np.array(self.sensor.vision.grid)
+        self.start = (env.visibility_radius, env.visibility_radius)
+
+def make_scenarios(visibility_radius: int, per_map: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    scenarios = []
+    for fname in MAPS:
+        circuit = grid_race_env.load_track_from_file(fname)
+        env = run.GridRaceEnv(1, visibility_radius, circuit)
+        env.reset()
+        cells = np.stack(np.nonzero(
+            np.vectorize(lambda c: c.traversable())(circuit.track))).T
+        for i in rng.choice(len(cells), size=per_map):
+            scenarios.append(Scenario(env, cells[i], rng))
+    return scenarios
+
+@contextlib.contextmanager
+def quiet():
+    # the planners report on stdout, that is not part of the measurements
+    with open(os.devnull, 'w') as devnull:
+        with contextlib.redirect_stdout(devnull):
+            yield
+
+def play(fname: str, visibility_radius: int, on_turn=None, **kwargs):
+    """
+    Play a single player game on the track ``fname`` with ``choose_action``
+    (``kwargs`` are passed on to it), calling ``on_turn(state)`` after every
+    decision. Returns the score.
+    """
+    circuit = grid_race_env.load_track_from_file(fname)
+    env = run.GridRaceEnv(1, visibility_radius, circuit)
+    with quiet():
+        sensor = Sensor(env.reset())
+    state = State(sensor)
+    player = None
+    while True:
+        with quiet():
+            player = env.next_player(player)
+        if player is None:
+            return env.get_scores()[0]
+        sensor.Sense(env.observation(player))
+        state.update_map(sensor.vision.grid)
+        radius = state.plan_radius
+        with quiet():
+            action = search.choose_action(radius, radius, sensor.physics.vx,
+                                          sensor.physics.vy,
+                                          state.map_window(radius), state,
+                                          **kwargs)
+        if on_turn is not None:
+            on_turn(state)
+        state.add_global(sensor.physics.x, sensor.physics.y)
+        env.step(player, action)
+
+def timed(function, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        tick = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - tick)
+    return best
+
+# 1}}} #
+
+# Benchmarks {{{1 #
+def bench_search(args: argparse.Namespace) -> None:
+    print(f'{"radius":>6} {"reference (ms)":>15} {"array (ms)":>11} '
+          f'{"speed-up":>9}')
+    for radius in args.radii:
+        scenarios = make_scenarios(radius, args.per_map)
+        reference_time = array_time = 0.
+        for sc in scenarios:
+            expected = reference_a_star_search(sc.grid, sc.start, sc.state)
+            with quiet():
+                path = search.a_star_search(sc.grid, sc.start, sc.state)
+                buffers = sc.state.search_buffers
+                got = path, buffers.to_dict(buffers.f)
+                array_time += timed(
+                    lambda: search.a_star_search(sc.grid, sc.start, sc.state),
+                    args.repeat)
+            assert got == expected, 'The planners disagree.'
+            reference_time += timed(
+                lambda: reference_a_star_search(sc.grid, sc.start, sc.state),
+                args.repeat)
+        n = len(scenarios)
+        print(f'{radius:>6} {1000 * reference_time / n:>15.3f} '
+              f'{1000 * array_time / n:>11.3f} '
+              f'{reference_time / array_time:>8.2f}x')
+
+def bench_velocity(args: argparse.Namespace) -> None:
+    budget = STEP_TIMEOUT - SAFETY_MARGIN
+    print(f'{"radius":>6} {"mean (ms)":>10} {"max (ms)":>9} '
+          f'{"mean expansions":>16} {"over budget":>12}')
+    rng = np.random.default_rng(0)
+    for radius in args.radii:
+        scenarios = make_scenarios(radius, args.per_map)
+        times = []
+        expansions = []
+        for sc in scenarios:
+            passable = (sc.grid >= 0) & (sc.grid != NOT_VISIBLE)
+            goals = sc.grid == GOAL
+            waypoints = np.zeros(sc.grid.shape, dtype=bool)
+            if not goals.any():
+                cells = np.stack(np.nonzero(passable)).T
+                waypoints[tuple(cells[rng.integers(len(cells))])] = True
+            vel = tuple(rng.integers(-1, 2, size=2).tolist())
+            tick = time.perf_counter()
+            plan = velocity_search.plan(sc.grid, sc.start, vel, goals,
+                                        waypoints)
+            times.append(time.perf_counter() - tick)
+            expansions.append(plan.expansions)
+        times = np.array(times)
+        print(f'{radius:>6} {1000 * times.mean():>10.3f} '
+              f'{1000 * times.max():>9.3f} {np.mean(expansions):>16.1f} '
+              f'{np.sum(times > budget):>12}')
+
+def bench_sensor(args: argparse.Namespace) -> None:
+    print(f'{"radius":>6} {"reference (ms)":>15} {"sensor (ms)":>12} '
+          f'{"speed-up":>9}')
+    rng = np.random.default_rng(0)
+    for radius in args.radii:
+        reference_time = sensor_time = 0.
+        n = 0
+        for fname in MAPS:
+            circuit = grid_race_env.load_track_from_file(fname)
+            env = run.GridRaceEnv(1, radius, circuit)
+            with quiet():
+                sensor = Sensor(env.reset())
+            cells = np.stack(np.nonzero(circuit.traversable)).T
+            for i in rng.choice(len(cells), size=args.per_map):
+                circuit.players[0].pos[()] = cells[i]
+                observation = env.observation(0)
+                _, players, grid = reference_sense(sensor.environment,
+                                                   observation)
+                sensor.Sense(observation)
+                assert (sensor.vision.players == players
+                        and np.array_equal(sensor.vision.grid, grid)
+                        ), 'The parsers disagree.'
+                reference_time += timed(
+                    lambda: reference_sense(sensor.environment, observation),
+                    args.repeat)
+                sensor_time += timed(lambda: sensor.Sense(observation),
+                                     args.repeat)
+                n += 1
+        print(f'{radius:>6} {1000 * reference_time / n:>15.3f} '
+              f'{1000 * sensor_time / n:>12.3f} '
+              f'{reference_time / sensor_time:>8.2f}x')
+
+def first_observations(fname: str, visibility_radius: int):
+    # what the judge sends before the first move: initial line and observation
+    circuit = grid_race_env.load_track_from_file(fname)
+    env = run.GridRaceEnv(1, visibility_radius, circuit)
+    with quiet():
+        initial = env.reset()
+    return initial + '\n', env.observation(0) + '\n'
+
+def start_main_bot(initial: str, observation: str):
+    # (connect, first move) seconds after starting src/main.py, playing the
+    # judge on its port
+    with socket.create_server(('localhost', network.JUDGE_PORT)) as server, \
+            tempfile.TemporaryDirectory() as cwd:
+        tick = time.perf_counter()
+        bot = subprocess.Popen(
+            [sys.executable, os.path.join(SRC_DIR, 'main.py')],
+            cwd=cwd,
+            stdout=subprocess.DEVNULL)
+        client, _ = server.accept()
+        connected = time.perf_counter()
+        with client:
+            network.send_data(client, initial)
+            network.send_data(client, observation)
+            network.recv_msg(client)
+            moved = time.perf_counter()
+            network.send_data(client, '~~~END~~~\n')
+            bot.wait()
+    return connected - tick, moved - tick
+
+def start_sample_bot(initial: str, observation: str):
+    # the sample bot talks on its standard input/output, no connecting
+    tick = time.perf_counter()
+    bot = subprocess.Popen([sys.executable, '-u', SAMPLE_BOT],
+                           stdin=subprocess.PIPE,
+                           stdout=subprocess.PIPE,
+                           text=True)
+    bot.stdin.write(initial + observation)
+    bot.stdin.flush()
+    bot.stdout.readline()
+    moved = time.perf_counter()
+    bot.communicate('~~~END~~~\n')
+    return None, moved - tick
+
+def bench_startup(args: argparse.Namespace) -> None:
+    initial, observation = first_observations(MAPS[0], args.radius)
+    print(f'{"bot":>8} {"connect (ms)":>13} {"first move (ms)":>16}')
+    for name, start in (('main', start_main_bot),
+                        ('sample', start_sample_bot)):
+        connect, move = zip(*(start(initial, observation)
+                              for _ in range(args.repeat)))
+        connect = ('-' if connect[0] is None else
+                   f'{1000 * np.median(connect):.1f}')
+        print(f'{name:>8} {connect:>13} {1000 * np.median(move):>16.1f}')
+
+def bench_incremental(args: argparse.Namespace) -> None:
+    print(f'{"map":>14} {"turns":>6} {"restarts":>9} '
+          f'{"expansions: incremental":>24} {"full":>6} '
+          f'{"time (ms): incremental":>23} {"full":>6}')
+    for fname in MAPS:
+        incremental = []
+        incremental_times = []
+        full = []
+        full_times = []
+        restarts = [0]
+
+        def on_turn(state: State):
+            planner = state.incremental_planner
+            incremental.append(planner.expansions)
+            incremental_times.append(planner.time)
+            restarts[0] = planner.restarts
+            # the same search from scratch, only the search is timed
+            replanner = incremental_search.DStarLite(state.global_map,
+                                                     planner.start,
+                                                     planner.target_distance,
+                                                     targets=planner.targets)
+            tick = time.perf_counter()
+            replanner.compute()
+            full_times.append(time.perf_counter() - tick)
+            full.append(replanner.expansions)
+            assert (replanner.g[planner.start] == planner.g[planner.start]
+                    ), 'Incremental and full replanning disagree.'
+
+        play(fname, args.radius, on_turn, planner='incremental')
+        name = os.path.splitext(os.path.basename(fname))[0]
+        print(f'{name:>14} {len(full):>6} {restarts[0]:>9} '
+              f'{np.mean(incremental):>24.1f} {np.mean(full):>6.1f} '
+              f'{1000 * np.mean(incremental_times):>23.3f} '
+              f'{1000 * np.mean(full_times):>6.3f}')
+
+# 1}}} #
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+    search_parser = subparsers.add_parser(
+        'search',
+        help='Compare a_star_search with the reference implementation on '
+        'windows cut from the maps in res/maps.')
+    search_parser.add_argument(
+        '--radii',
+        type=int,
+        nargs='+',
+        default=[4, 8, 16],
+        help='Visibility radii to measure. Default is 4 8 16.')
+    search_parser.add_argument(
+        '--per_map',
+        type=int,
+        default=10,
+        help='Number of positions per map. Default is 10.')
+    search_parser.add_argument(
+        '--repeat',
+        type=int,
+        default=5,
+        help='Repetitions per position, the best one counts. Default is 5.')
+    search_parser.set_defaults(function=bench_search)
+    velocity_parser = subparsers.add_parser(
+        'velocity',
+        help='Time velocity_search.plan without a deadline on windows cut '
+        'from the maps in res/maps, against the per-turn time budget.')
+    velocity_parser.add_argument(
+        '--radii',
+        type=int,
+        nargs='+',
+        default=[4, 8, 16],
+        help='Visibility radii to measure. Default is 4 8 16.')
+    velocity_parser.add_argument(
+        '--per_map',
+        type=int,
+        default=20,
+        help='Number of positions per map. Default is 20.')
+    velocity_parser.set_defaults(function=bench_velocity)
+    sensor_parser = subparsers.add_parser(
+        'sensor',
+        help='Compare Sensor.Sense with the former line by line parser on '
+        'observations of the maps in res/maps.')
+    sensor_parser.add_argument(
+        '--radii',
+        type=int,
+        nargs='+',
+        default=[8, 16, 32, 64],
+        help='Visibility radii to measure. Default is 8 16 32 64.')
+    sensor_parser.add_argument(
+        '--per_map',
+        type=int,
+        default=5,
+        help='Number of positions per map. Default is 5.')
+    sensor_parser.add_argument(
+        '--repeat',
+        type=int,
+        default=5,
+        help='Repetitions per position, the best one counts. Default is 5.')
+    sensor_parser.set_defaults(function=bench_sensor)
+    startup_parser = subparsers.add_parser(
+        'startup',
+        help='Start src/main.py and the sample bot, and measure the time to '
+        'connect and to send the first move. Needs the judge port free.')
+    startup_parser.add_argument(
+        '--radius',
+        type=int,
+        default=8,
+        help='Visibility radius. Default is 8.')
+    startup_parser.add_argument(
+        '--repeat',
+        type=int,
+        default=5,
+        help='Number of starts per bot, the median counts. Default is 5.')
+    startup_parser.set_defaults(function=bench_startup)
+    incremental_parser = subparsers.add_parser(
+        'incremental',
+        help='Play a game on each map in res/maps with the incremental '
+        'planner, and compare its expansions and time per turn with replanning '
+        'from scratch.')
+    incremental_parser.add_argument(
+        '--radius',
+        type=int,
+        default=8,
+        help='Visibility radius. Default is 8.')
+    incremental_parser.set_defaults(function=bench_incremental)
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    args.function(args)
+
+if __name__ == "__main__":
+    main()
+
+# vim:set et sw=4 ts=4 fdm=marker:
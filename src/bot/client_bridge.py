@@ -1,122 +1,309 @@
 #!/usr/bin/env python
 import os
-import subprocess
 import asyncio
+import contextlib
 import datetime
+import importlib.util
+import io
 import threading
-import socket
+import time
+import traceback
 import argparse
 import sys
 import network
 
 LOGGING = True
+# The log is written in batches, at least this often (seconds)
+FLUSH_INTERVAL = 0.5
+# Time the bot gets to exit after the bridge is done (seconds)
+EXIT_TIMEOUT = 1.0
 
 class Logger:
+    """
+    Collects the log lines in memory, a background task writes them out in
+    batches, so relaying never waits for the disk. Timestamps are seconds
+    since the logger started, on the monotonic clock.
+    """
 
     def __init__(self, fname: str):
-        self.f = open(fname, 'w')  # pylint: disable=consider-using-with
-        self.lock = threading.Lock()
+        self.fname = fname
+        self.start = time.monotonic()
+        self.lines = [f'started at {datetime.datetime.now().isoformat()}\n']
+        self.writer = None
+
+    async def run(self):
+        # opened here, not to block the caller
+        f = await asyncio.to_thread(open, self.fname, 'w')
+        try:
+            while True:
+                await asyncio.sleep(FLUSH_INTERVAL)
+                await self._flush(f)
+        finally:
+            # cancelled at shutdown: write what is left
+            await self._flush(f)
+            await asyncio.to_thread(f.close)
+
+    async def _flush(self, f):
+        if not self.lines:
+            return
+        batch, self.lines = self.lines, []
+        await asyncio.to_thread(self._write, f, batch)
+
+    @staticmethod
+    def _write(f, batch: list[str]):
+        f.writelines(batch)
+        f.flush()
+
+    def _log(self, stream: str, msg: str):
+        self.lines.append(
+            f'{time.monotonic() - self.start:12.6f} - {stream} :: {msg}\n')
 
     def write_stdout(self, msg: str):
-        with self.lock:
-            self.f.write(
-                f'{datetime.datetime.now().time().isoformat()} - stdout :: '
-                f'{msg}\n')
-            self.f.flush()
+        self._log('stdout', msg)
 
     def write_stderr(self, msg: str):
-        with self.lock:
-            self.f.write(
-                f'{datetime.datetime.now().time().isoformat()} - stderr :: '
-                f'{msg}\n')
-            self.f.flush()
+        self._log('stderr', msg)
 
     def write_stdin(self, msg: str):
-        with self.lock:
-            self.f.write(
-                f'{datetime.datetime.now().time().isoformat()} - stdin  :: '
-                f'{msg}\n')
-            self.f.flush()
+        self._log('stdin ', msg)
+
+    def open(self):
+        self.writer = asyncio.create_task(self.run())
 
-    def close(self):
-        with self.lock:
-            self.f.close()
+    async def close(self):
+        if self.writer is not None:
+            self.writer.cancel()
+            await asyncio.gather(self.writer, return_exceptions=True)
+            self.writer = None
 
 class SubmissionManager():
 
-    def __init__(self, judge_address: str, exe_cmd: list[str]) -> None:
+    def __init__(self,
+                 judge_address: str,
+                 exe_cmd: list[str],
+                 log_suffix: str = '') -> None:
+        # ``log_suffix`` tells apart the logs of bots started together
+        self.judge_address = judge_address
+        self.exe_cmd = exe_cmd
         if LOGGING:
             self.logger = Logger(
                 'communication.'
                 f'{datetime.datetime.now().strftime("%Y%m%d_%H%M%S.%f")[:-3]}'
-                '.log')
+                f'{log_suffix}.log')
         else:
             self.logger = None
-        # Connect to judge
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.socket.connect((judge_address, network.JUDGE_PORT))
-        # Start submitted program
-        self.submission_process = subprocess.Popen(  # pylint: disable=R1732
-            exe_cmd,
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True)
+        self.reader = self.writer = None
+        self.submission_process = None
 
     async def start(self):
         if LOGGING:
-            task = asyncio.gather(
-                asyncio.to_thread(self.read_stderr),
-                asyncio.to_thread(self.read_stdout),
-                asyncio.to_thread(self.listen_to_server))
+            self.logger.open()
+        # Connect to judge
+        self.reader, self.writer = await asyncio.open_connection(
+            self.judge_address, network.JUDGE_PORT)
+        await self.relay()
+
+    async def relay(self):
+        # Start submitted program
+        self.submission_process = await asyncio.create_subprocess_exec(
+            *self.exe_cmd,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE)
+        if LOGGING:
+            task = asyncio.gather(self.read_stderr(), self.read_stdout(),
+                                  self.listen_to_server())
         else:
-            task = asyncio.gather(
-                asyncio.to_thread(self.read_stdout),
-                asyncio.to_thread(self.listen_to_server))
+            task = asyncio.gather(self.read_stdout(), self.listen_to_server())
         await task
 
-    def read_stdout(self):
+    @staticmethod
+    def _decode(line: bytes) -> str:
+        line = line.decode()
+        return line[:-1] if line.endswith('\n') else line
+
+    async def read_stdout(self):
         while True:
             # ``readline`` will return the ending newline, this is good when
             # the line is empty (i.e., it will return a string with the newline
             # character, and it will not quit the loop). At EOF, however, it
             # will return an empty string.
-            line = self.submission_process.stdout.readline()
+            line = await self.submission_process.stdout.readline()
             if not line:
                 break
+            line = self._decode(line)
             if LOGGING:
-                self.logger.write_stdout(line[:-1])
-            network.send_data(self.socket, line[:-1])
+                self.logger.write_stdout(line)
+            try:
+                await network.send_data_async(self.writer, line)
+            except network.NetworkError:
+                break  # Server terminated.
 
-    def read_stderr(self):
-        # stderr goes only to logging, this thread shouldn't have been
-        # started otherwise
+    async def read_stderr(self):
+        # stderr goes only to logging, this task shouldn't have been started
+        # otherwise
         assert LOGGING
         while True:
-            line = self.submission_process.stderr.readline()
+            line = await self.submission_process.stderr.readline()
             if not line:
                 break
-            self.logger.write_stderr(line[:-1])
+            self.logger.write_stderr(self._decode(line))
 
-    def listen_to_server(self):
+    async def listen_to_server(self):
+        stdin = self.submission_process.stdin
         try:
             while True:
-                msg = network.recv_msg(self.socket)
+                msg = await network.recv_msg_async(self.reader)
                 assert msg['type'] == 'data', \
                         f'{msg["type"]} messages aren\'t supported yet.'
                 if LOGGING:
                     self.logger.write_stdin(msg['data'][:-1])
-                self.submission_process.stdin.write(msg['data'])
-                self.submission_process.stdin.flush()
+                stdin.write(msg['data'].encode())
+                await stdin.drain()
         except network.NetworkError:
             pass  # Server terminated. Farewell.
-        except BrokenPipeError:
+        except (BrokenPipeError, ConnectionResetError):
             print('Error: can\'t write to client. Maybe it terminated?')
 
-    def close(self) -> None:
-        self.submission_process.terminate()
+    async def close(self) -> None:
+        if self.submission_process is not None:
+            # it exits by itself at the end of the game, give it the chance
+            try:
+                await asyncio.wait_for(self.submission_process.wait(),
+                                       EXIT_TIMEOUT)
+            except asyncio.TimeoutError:
+                self.submission_process.terminate()
+                await self.submission_process.wait()
+        if self.writer is not None:
+            self.writer.close()
+        if LOGGING:
+            await self.logger.close()
+
+    async def run(self):
+        try:
+            await self.start()
+        finally:
+            await self.close()
+
+class ThreadStderr:
+    """
+    Stands in for ``sys.stderr`` while bots run in process: what a thread
+    writes goes to the stream it set with ``capture``, anything else to the
+    stderr it replaced. ``redirect_stderr`` would swap the stderr of every
+    thread, and bots run in threads at the same time.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    @classmethod
+    def install(cls) -> 'ThreadStderr':
+        if not isinstance(sys.stderr, cls):
+            sys.stderr = cls(sys.stderr)
+        return sys.stderr
+
+    @contextlib.contextmanager
+    def capture(self, target: io.TextIOBase):
+        self.local.target = target
+        try:
+            yield
+        finally:
+            self.local.target = None
+
+    def _target(self):
+        target = getattr(self.local, 'target', None)
+        return self.stream if target is None else target
+
+    def write(self, s: str) -> int:
+        return self._target().write(s)
+
+    def flush(self) -> None:
+        self._target().flush()
+
+    def __getattr__(self, name: str):
+        return getattr(self.stream, name)
+
+class ModuleManager(SubmissionManager):
+    """
+    Runs a Python bot inside the bridge, without pipes: the bot module's
+    ``make_player(initial_observation)`` returns a function answering each
+    observation with the line the bot would print, or None at the end.
+    """
+
+    def __init__(self,
+                 judge_address: str,
+                 fname: str,
+                 log_suffix: str = '') -> None:
+        super().__init__(judge_address, [fname], log_suffix)
+        self.fname = fname
+        self.player = None
+        self.stderr = ThreadStderr.install()
+
+    def load_module(self):
+        # the bot imports its neighbours as top level modules
+        sys.path.insert(0, os.path.dirname(os.path.abspath(self.fname)))
+        name = os.path.splitext(os.path.basename(self.fname))[0]
+        spec = importlib.util.spec_from_file_location(name, self.fname)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module
+
+    def call_player(self, observation: str):
+        # What the bot writes to stderr is logged, like in a subprocess. If the
+        # bot raises, the traceback goes there too, and ``failed`` is set.
+        stderr = io.StringIO()
+        answer = None
+        failed = False
+        with self.stderr.capture(stderr):
+            try:
+                if self.player is None:
+                    self.player = self.module.make_player(observation)
+                else:
+                    answer = self.player(observation)
+            except Exception:
+                traceback.print_exc(file=stderr)
+                failed = True
+        return answer, stderr.getvalue(), failed
+
+    def bot_failed(self, stderr: str) -> None:
+        print(f'Error: bot {self.fname} raised an exception, disconnecting '
+              'it.', file=sys.stderr)
         if LOGGING:
-            self.logger.close()
+            for line in stderr.splitlines():
+                self.logger.write_stderr(line)
+
+    async def relay(self):
+        try:
+            self.module = self.load_module()
+        except Exception:
+            self.bot_failed(traceback.format_exc())
+            return
+        try:
+            while True:
+                msg = await network.recv_msg_async(self.reader)
+                assert msg['type'] == 'data', \
+                        f'{msg["type"]} messages aren\'t supported yet.'
+                if LOGGING:
+                    self.logger.write_stdin(msg['data'][:-1])
+                # in a thread, so the log keeps being written meanwhile
+                answer, stderr, failed = await asyncio.to_thread(
+                    self.call_player, msg['data'])
+                if failed:
+                    # the connection is closed by ``run``, the other bots
+                    # play on
+                    self.bot_failed(stderr)
+                    return
+                if LOGGING:
+                    for line in stderr.splitlines():
+                        self.logger.write_stderr(line)
+                if answer is None:
+                    continue
+                if LOGGING:
+                    self.logger.write_stdout(answer)
+                await network.send_data_async(self.writer, answer)
+        except network.NetworkError:
+            pass  # Server terminated. Farewell.
 
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(
@@ -125,13 +312,27 @@ def parse_args() -> argparse.Namespace:
         'the network.')
     parser.add_argument(
         'bot_exe',
+        nargs='+',
         help='Path to the bot executable (must have executable or read '
-        'permissions).')
+        'permissions). Several bots can be given, all of them are connected '
+        'to the judge by this one process.')
+    parser.add_argument(
+        '--counts',
+        type=int,
+        nargs='+',
+        default=None,
+        help='Number of instances of each bot, in the order of bot_exe. '
+        'Default is one of each.')
     parser.add_argument(
         '--judge_address',
         type=str,
         default='localhost',
         help='Address of the judge system. Default is localhost.')
+    parser.add_argument(
+        '--in_process',
+        action='store_true',
+        help='Run a Python bot inside the bridge instead of as a subprocess. '
+        'The bot has to provide make_player, like the sample bot.')
     return parser.parse_args()
 
 def get_execute_command(fname: str) -> list[str]:
@@ -147,16 +348,51 @@ def get_execute_command(fname: str) -> list[str]:
     print('Error: unknown filetype. Exiting.', file=sys.stderr)
     return []
 
+def make_managers(args: argparse.Namespace) -> list[SubmissionManager]:
+    counts = args.counts
+    if counts is None:
+        counts = [1] * len(args.bot_exe)
+    if len(counts) != len(args.bot_exe):
+        print('Error: give one count per bot. Exiting.', file=sys.stderr)
+        return []
+    bots = [fname for fname, count in zip(args.bot_exe, counts)
+            for _ in range(count)]
+    managers = []
+    for i, fname in enumerate(bots):
+        log_suffix = f'.{i}' if len(bots) > 1 else ''
+        if args.in_process:
+            if not fname.endswith('.py'):
+                print('Error: only Python bots can run in process. Exiting.',
+                      file=sys.stderr)
+                return []
+            managers.append(
+                ModuleManager(args.judge_address, fname, log_suffix))
+        else:
+            cmd = get_execute_command(fname)
+            if not cmd:
+                return []
+            managers.append(
+                SubmissionManager(args.judge_address, cmd, log_suffix))
+    return managers
+
+async def run_all(managers: list[SubmissionManager]):
+    # Every bot on the same event loop. One of them failing, or not getting
+    # through to the judge, does not stop the others.
+    results = await asyncio.gather(*(manager.run() for manager in managers),
+                                   return_exceptions=True)
+    for manager, result in zip(managers, results):
+        if isinstance(result, Exception):
+            print(f'Error: bot {" ".join(manager.exe_cmd)} stopped: '
+                  f'{result!r}', file=sys.stderr)
+
 def main():
     args = parse_args()
-    cmd = get_execute_command(args.bot_exe)
-    if not cmd:
+    managers = make_managers(args)
+    if not managers:
         return
-    manager = SubmissionManager(args.judge_address, cmd)
     try:
-        asyncio.run(manager.start())
+        asyncio.run(run_all(managers))
     except KeyboardInterrupt:
-        manager.close()
         print('Received keyboard interrupt. Bye.')
 
 if __name__ == "__main__":
@@ -26,6 +26,8 @@ class Circuit(NamedTuple):
     track_shape: tuple[int, int]
     num_players: int
     visibility_radius: int
+    # only the players within the visibility radius are sent
+    filtered_players: bool = False
 
 class State(NamedTuple):
     circuit: Circuit
@@ -33,12 +35,13 @@ class State(NamedTuple):
     players: list[Player]
     agent: Player
 
-def read_initial_observation() -> Circuit:
-    H, W, num_players, visibility_radius = map(int, input().split())
-    return Circuit((H, W), num_players, visibility_radius)
+def read_initial_observation(read_line=input) -> Circuit:
+    H, W, num_players, visibility_radius, *flags = map(int, read_line().split())
+    filtered_players = bool(flags and flags[0])
+    return Circuit((H, W), num_players, visibility_radius, filtered_players)
 
-def read_observation(old_state: State) -> Optional[State]:
-    line = input()
+def read_observation(old_state: State, read_line=input) -> Optional[State]:
+    line = read_line()
     if line == '~~~END~~~':
         return None
     posx, posy, velx, vely = map(int, line.split())
@@ -46,14 +49,22 @@ def read_observation(old_state: State) -> Optional[State]:
     players = []
     # this won't change
     circuit_data = old_state.circuit
-    for _ in range(circuit_data.num_players):
-        pposx, pposy = map(int, input().split())
+    if circuit_data.filtered_players:
+        num_visible_players = int(read_line())
+    else:
+        num_visible_players = circuit_data.num_players
+    for _ in range(num_visible_players):
+        pposx, pposy = map(int, read_line().split())
         # Calculating the velocity from the old state is left as an exercise to
         # the reader.
         players.append(Player(pposx, pposy, 0, 0))
-    visible_track = np.full(circuit_data.track_shape, CellType.WALL.value)
+    # The track does not change, so the map seen so far is kept and updated in
+    # place. Cells never seen are walls, we can't risk it.
+    visible_track = old_state.visible_track
+    if visible_track is None:
+        visible_track = np.full(circuit_data.track_shape, CellType.WALL.value)
     for i in range(2 * circuit_data.visibility_radius + 1):
-        line = [int(a) for a in input().split()]
+        line = np.array([int(a) for a in read_line().split()])
         x = posx - circuit_data.visibility_radius + i
         if x < 0 or x >= circuit_data.track_shape[0]:
             continue
@@ -65,10 +76,8 @@ def read_observation(old_state: State) -> Optional[State]:
         if y_end > circuit_data.track_shape[1]:
             line = line[:-(y_end - circuit_data.track_shape[1])]
             y_end = circuit_data.track_shape[1]
-        visible_track[x, y_start:y_end] = line
-    # We can't risk it. Put walls everywhere we can't see. Just to be safe.
-    visible_track[visible_track == CellType.NOT_VISIBLE.value] = (
-        CellType.WALL.value)
+        np.copyto(visible_track[x, y_start:y_end], line,
+                  where=line != CellType.NOT_VISIBLE.value)
     return old_state._replace(
         visible_track=visible_track, players=players, agent=agent)
 
@@ -169,5 +178,29 @@ def main():
         delta = calculate_move(rng, state)
         print(f'{delta[0]} {delta[1]}')
 
+def make_player(initial_observation: str):
+    """
+    The bot without standard input/output, for running it inside
+    ``client_bridge.py --in_process``: takes the judge's initial observation,
+    and returns a function answering an observation with the line ``main``
+    would print (None at the end of the game).
+    """
+    circuit = read_initial_observation(
+        iter(initial_observation.splitlines()).__next__)
+    state: Optional[State] = State(circuit, None, [], None)  # type: ignore
+    rng = np.random.default_rng(seed=1)
+
+    def player(observation: str) -> Optional[str]:
+        nonlocal state
+        assert state is not None
+        state = read_observation(state,
+                                 iter(observation.splitlines()).__next__)
+        if state is None:
+            return None
+        delta = calculate_move(rng, state)
+        return f'{delta[0]} {delta[1]}'
+
+    return player
+
 if __name__ == "__main__":
     main()
@@ -1,14 +1,29 @@
+import argparse
+import multiprocessing
+import os
 import numpy as np
+import matplotlib
+# only ever drawn to files
+matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 import matplotlib.colors as mcolors
+from PIL import Image
+from f_score_history import FScoreStore
+
+# colour of the cells the search did not get to
+BACKGROUND = (255, 255, 255)
 
 def generate_colored_map(f_score_map, grid_shape, output_file):
-    # Initialize the 2D array with NaN values for non-visited nodes
-    f_score_array = np.full(grid_shape, np.nan)
+    if isinstance(f_score_map, np.ndarray):
+        # already dense, NaN for non-visited nodes
+        f_score_array = f_score_map.reshape(grid_shape).astype(float)
+    else:
+        # Initialize the 2D array with NaN values for non-visited nodes
+        f_score_array = np.full(grid_shape, np.nan)
 
-    # Fill the array with f_score values from the map
-    for (x, y), f_score in f_score_map.items():
-        f_score_array[x, y] = f_score
+        # Fill the array with f_score values from the map
+        for (x, y), f_score in f_score_map.items():
+            f_score_array[x, y] = f_score
 
     # Normalize the f_score values to the range [0, 1]
     min_f_score = np.nanmin(f_score_array)
@@ -20,7 +35,7 @@ def generate_colored_map(f_score_map, grid_shape, output_file):
     norm = mcolors.Normalize(vmin=0, vmax=1)
 
     # Plot the color map
-    plt.figure(figsize=(8, 8))
+    fig = plt.figure(figsize=(8, 8))
     plt.imshow(normalized_f_score_array, cmap=cmap, norm=norm, origin='lower')
     plt.colorbar(label='Normalized f_score')
     plt.title('f_score Map')
@@ -28,3 +43,126 @@ def generate_colored_map(f_score_map, grid_shape, output_file):
     plt.ylabel('Second')
 
     plt.savefig(output_file)
+    plt.close(fig)
+
+# Batch rendering {{{1 #
+def load_f_maps(directory: str) -> list[np.ndarray]:
+    # the fields of a game saved by ``f_score_history.FScoreStore``, in order
+    return FScoreStore.load(directory)
+
+def f_score_frames(fields, scale: int = 8, cmap: str = 'viridis'):
+    """
+    One RGB image per f-score field, coloured like ``generate_colored_map``
+    (every field normalized on its own, row 0 at the bottom), each cell
+    ``scale`` pixels wide. The colours are looked up from a table, pyplot is
+    not involved.
+    """
+    lut = (plt.get_cmap(cmap)(np.linspace(0, 1, 256))[:, :3] * 255).astype(
+        np.uint8)
+    height = max(field.shape[0] for field in fields)
+    width = max(field.shape[1] for field in fields)
+    frames = []
+    for field in fields:
+        padded = np.full((height, width), np.nan)
+        padded[:field.shape[0], :field.shape[1]] = field
+        seen = ~np.isnan(padded)
+        rgb = np.empty((height, width, 3), dtype=np.uint8)
+        rgb[...] = BACKGROUND
+        if seen.any():
+            low = padded[seen].min()
+            span = padded[seen].max() - low
+            if span == 0:
+                span = 1
+            index = ((padded[seen] - low) / span * 255).round().astype(int)
+            rgb[seen] = lut[index]
+        rgb = rgb[::-1].repeat(scale, axis=0).repeat(scale, axis=1)
+        frames.append(Image.fromarray(rgb))
+    return frames
+
+def render_game(fields, output_file: str, scale: int = 8,
+                duration: int = 200, columns: int = None):
+    """
+    Render a game's f-score fields, either as an animation (``.gif``, a frame
+    every ``duration`` ms) or as a sprite sheet (any other image format).
+    """
+    frames = f_score_frames(fields, scale)
+    if not frames:
+        return
+    if output_file.lower().endswith('.gif'):
+        frames[0].save(output_file, save_all=True, append_images=frames[1:],
+                       duration=duration, loop=0)
+        return
+    if columns is None:
+        columns = int(np.ceil(np.sqrt(len(frames))))
+    rows = -(-len(frames) // columns)
+    tile_width, tile_height = frames[0].size
+    sheet = Image.new('RGB', (columns * tile_width, rows * tile_height),
+                      BACKGROUND)
+    for i, frame in enumerate(frames):
+        row, column = divmod(i, columns)
+        sheet.paste(frame, (column * tile_width, row * tile_height))
+    sheet.save(output_file)
+
+def _render_file(job):
+    fname, output_file, scale, duration = job
+    render_game(load_f_maps(fname), output_file, scale, duration)
+    return output_file
+
+def render_games(fnames, output_dir: str, extension: str = '.gif',
+                 scale: int = 8, duration: int = 200, processes: int = None):
+    # one game per process
+    os.makedirs(output_dir, exist_ok=True)
+    jobs = [(fname,
+             os.path.join(output_dir,
+                          os.path.basename(os.path.normpath(fname))
+                          + extension), scale, duration) for fname in fnames]
+    with multiprocessing.Pool(processes) as pool:
+        for output_file in pool.imap_unordered(_render_file, jobs):
+            print(f'Saved {output_file}')
+
+# 1}}} #
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description='Render the f-score fields saved by the bot (main.py '
+        '--f_maps) as animations or sprite sheets.')
+    parser.add_argument('f_maps',
+                        nargs='+',
+                        help='Directories written by the bot, one per '
+                        'game.')
+    parser.add_argument(
+        '--output_dir',
+        type=str,
+        default='.',
+        help='Directory of the rendered files. Default is the current one.')
+    parser.add_argument(
+        '--format',
+        choices=['gif', 'png'],
+        default='gif',
+        help='gif for an animation, png for a sprite sheet. Default is gif.')
+    parser.add_argument('--scale',
+                        type=int,
+                        default=8,
+                        help='Pixels per cell. Default is 8.')
+    parser.add_argument(
+        '--duration',
+        type=int,
+        default=200,
+        help='Time a frame of an animation is shown (ms). Default is 200.')
+    parser.add_argument(
+        '--processes',
+        type=int,
+        default=None,
+        help='Number of games rendered at the same time. Default is the '
+        'number of CPUs.')
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    render_games(args.f_maps, args.output_dir, '.' + args.format, args.scale,
+                 args.duration, args.processes)
+
+if __name__ == "__main__":
+    main()
+
+# vim:set et sw=4 ts=4 fdm=marker:
@@ -0,0 +1,81 @@
+import os
+from collections import deque
+import numpy as np
+
+class FScoreStore:
+    """
+    Writes f-score fields one by one into a directory, each to its own
+    compressed ``.npz`` file, so they do not have to be kept in memory. A
+    field's file is complete once it appears, if the bot dies the fields of
+    the turns before are still readable. The field with index ``i`` is under
+    ``FScoreStore.KEY`` in ``FScoreStore.fname(i)``, ``load`` reads them all.
+    """
+
+    KEY = 'f_map'
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def fname(index: int) -> str:
+        return f'f_map_{index:04d}.npz'
+
+    def write(self, index: int, field: np.ndarray):
+        path = os.path.join(self.directory, self.fname(index))
+        # under another name until written, the file is all or nothing
+        with open(path + '.part', 'wb') as f:
+            np.savez_compressed(f, **{self.KEY: field})
+        os.replace(path + '.part', path)
+
+    def close(self):
+        pass
+
+    @classmethod
+    def load(cls, directory: str) -> list[np.ndarray]:
+        # the fields in order
+        fields = []
+        for fname in sorted(os.listdir(directory)):
+            if fname.startswith('f_map_') and fname.endswith('.npz'):
+                with np.load(os.path.join(directory, fname)) as f:
+                    fields.append(f[cls.KEY])
+        return fields
+
+class FScoreHistory:
+    """
+    The f-score fields of the A* searches as dense arrays (NaN where the
+    search did not get), numbered from 0 in the order they were added. Only
+    the last ``depth`` fields and the ``pinned`` ones are kept, every field is
+    written to the ``store`` if there is one.
+    """
+
+    def __init__(self, depth=16, store: FScoreStore = None, pinned=()):
+        self.recent = deque(maxlen=depth)
+        self.pinned = {index: None for index in pinned}
+        self.store = store
+        self.count = 0
+
+    def append(self, field: np.ndarray):
+        field = field.astype(np.float32)
+        if self.count in self.pinned:
+            self.pinned[self.count] = field
+        self.recent.append((self.count, field))
+        if self.store is not None:
+            self.store.write(self.count, field)
+        self.count += 1
+
+    def get(self, index: int):
+        # None if the field is not kept (or not added yet)
+        if self.pinned.get(index) is not None:
+            return self.pinned[index]
+        for i, field in self.recent:
+            if i == index:
+                return field
+        return None
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        if self.store is not None:
+            self.store.close()
@@ -0,0 +1,288 @@
+import heapq
+import time
+import numpy as np
+from state import *
+
+INFINITY = float('inf')
+# how far the cells explored are, in visibility radii
+TARGET_DISTANCE = 2
+
+class DStarLite:
+    """
+    D* Lite over the cells of ``State.global_map``: 4-connected, every step
+    costs one, and cells not seen yet are assumed to be free. So a newly seen
+    cell changes a cost only if it is a wall or a goal, and ``update``
+    repairs only what those affect. The search state is kept between turns.
+
+    The search runs from a virtual goal. GOAL cells lead to it at no cost,
+    ``targets`` at ``explore_cost``, and those are not crossed. The targets
+    are the nearest cells not seen yet at least ``target_distance`` steps
+    from the bot. They stay until the bot is halfway to the one it is heading
+    for, then new ones are picked and the search starts over. So the plan
+    heads for the goal when a way to it is known, otherwise out into the
+    cells not seen yet.
+
+    The map has to be padded with walls (as ``State.global_map`` is): the
+    neighbours of a cell are found by adding to its id.
+    """
+
+    def __init__(self, global_map, start, target_distance, explore_cost=None,
+                 targets=None):
+        height, width = global_map.shape
+        assert (np.all(global_map[[0, -1]] == WALL)
+                and np.all(global_map[:, [0, -1]] == WALL)), \
+                'The map has to be padded with walls.'
+        self.shape = global_map.shape
+        self.width = width
+        self.offsets = (-width, width, -1, 1)
+        if explore_cost is None:
+            # any known way to the goal beats exploring
+            explore_cost = height * width
+        self.explore_cost = explore_cost
+        self.target_distance = target_distance
+        self.known = global_map.copy()
+        self.value = self.known.ravel().tolist()
+        self.start = start
+        # work done by the last update and compute
+        self.expansions = 0
+        self.frontier_peak = 0
+        self.time = 0.
+        # number of updates that picked new targets and started over
+        self.restarts = 0
+        self._restart(targets)
+
+    def _pick_targets(self):
+        # The cells not seen yet far enough from the bot, only the ones next
+        # to a nearer or a seen cell: the others are never the nearest. If
+        # everything that far has been seen, the ones next to a seen cell.
+        sx, sy = divmod(self.start, self.width)
+        xs, ys = np.indices(self.shape)
+        not_seen = self.known == NOT_VISIBLE
+        far = not_seen & (np.abs(xs - sx) + np.abs(ys - sy)
+                          >= self.target_distance)
+        if not far.any():
+            far = not_seen
+        near = ~far
+        border = np.zeros_like(near)
+        border[1:] |= near[:-1]
+        border[:-1] |= near[1:]
+        border[:, 1:] |= near[:, :-1]
+        border[:, :-1] |= near[:, 1:]
+        return far & border
+
+    def _restart(self, targets=None):
+        # a search from scratch
+        size = len(self.value)
+        self.g = [INFINITY] * size
+        self.rhs = [INFINITY] * size
+        # key of the cell in the priority queue, None if it is not queued
+        self.queued = [None] * size
+        self.pq = []
+        if targets is None:
+            targets = self._pick_targets()
+        self.targets = targets
+        self.is_target = set(np.flatnonzero(targets).tolist())
+        # where the last path ended
+        self.heading = None
+        for cell in np.flatnonzero((self.known == GOAL) | targets).tolist():
+            self._update_vertex(cell)
+
+    def _exit_cost(self, cell):
+        # cost of leaving for the virtual goal, None for ordinary cells
+        if self.value[cell] == GOAL:
+            return 0
+        if cell in self.is_target:
+            return self.explore_cost
+        return None
+
+    def _heuristic(self, cell):
+        x, y = divmod(cell, self.width)
+        sx, sy = divmod(self.start, self.width)
+        return abs(x - sx) + abs(y - sy)
+
+    def _key(self, cell):
+        m = min(self.g[cell], self.rhs[cell])
+        return (m + self._heuristic(cell), m)
+
+    def _push(self, cell):
+        key = self._key(cell)
+        self.queued[cell] = key
+        heapq.heappush(self.pq, (key, cell))
+
+    def _rekey(self):
+        # The keys depend on the start. Recomputing the queued ones is cheaper
+        # than popping and pushing back each stale one later.
+        self.pq = [(self._key(cell), cell) for key, cell in self.pq
+                   if self.queued[cell] == key]
+        for key, cell in self.pq:
+            self.queued[cell] = key
+        heapq.heapify(self.pq)
+
+    def _top_key(self):
+        # drop the entries superseded since they were pushed
+        while self.pq:
+            key, cell = self.pq[0]
+            if self.queued[cell] == key:
+                return key
+            heapq.heappop(self.pq)
+        return (INFINITY, INFINITY)
+
+    def _update_vertex(self, cell):
+        value = self.value[cell]
+        if value == WALL:
+            self.rhs[cell] = INFINITY
+        else:
+            exit_cost = self._exit_cost(cell)
+            if exit_cost is not None:
+                self.rhs[cell] = exit_cost
+            else:
+                g, values = self.g, self.value
+                self.rhs[cell] = min(
+                    (1 + g[cell + d] for d in self.offsets
+                     if values[cell + d] != WALL),
+                    default=INFINITY)
+        if self.g[cell] != self.rhs[cell]:
+            self._push(cell)
+        else:
+            self.queued[cell] = None
+
+    def _update_predecessors(self, cell):
+        # only ordinary cells depend on their neighbours
+        for d in self.offsets:
+            n = cell + d
+            if self.value[n] != WALL and self._exit_cost(n) is None:
+                self._update_vertex(n)
+
+    def update(self, global_map, start):
+        """
+        Take in the cells seen since the last call and the new position of
+        the bot (a cell id of ``global_map``).
+        """
+        tick = time.perf_counter()
+        self.start = start
+        changed = np.flatnonzero(self.known != global_map)
+        if len(changed):
+            np.copyto(self.known, global_map)
+            values = self.known.ravel()[changed].tolist()
+            changed = changed.tolist()
+            for cell, value in zip(changed, values):
+                self.value[cell] = value
+        if (self.heading is not None
+                and 2 * self._heuristic(self.heading) < self.target_distance):
+            # about to see where it was heading
+            self._restart()
+            self.restarts += 1
+            self.time = time.perf_counter() - tick
+            return
+        self._rekey()
+        for cell in changed:
+            # seen free cells were assumed to be free already
+            if self.value[cell] in (WALL, GOAL):
+                self._update_vertex(cell)
+                self._update_predecessors(cell)
+        self.time = time.perf_counter() - tick
+
+    def compute(self, deadline=None):
+        """
+        Repair the distances until the one of the start is correct. Returns
+        False if the deadline passed first, the next call carries on.
+        """
+        tick = time.perf_counter()
+        self.expansions = 0
+        self.frontier_peak = len(self.pq)
+        g, rhs, start = self.g, self.rhs, self.start
+        while (self._top_key() < self._key(start) or rhs[start] != g[start]):
+            if deadline is not None and time.perf_counter() >= deadline:
+                self.time += time.perf_counter() - tick
+                return False
+            key_old, cell = heapq.heappop(self.pq)
+            self.queued[cell] = None
+            self.expansions += 1
+            key_new = self._key(cell)
+            if key_old < key_new:
+                self._push(cell)
+            elif g[cell] > rhs[cell]:
+                g[cell] = rhs[cell]
+                self._update_predecessors(cell)
+            else:
+                g[cell] = INFINITY
+                self._update_vertex(cell)
+                self._update_predecessors(cell)
+            if len(self.pq) > self.frontier_peak:
+                self.frontier_peak = len(self.pq)
+        self.time += time.perf_counter() - tick
+        return True
+
+    def path(self, max_length=None):
+        """
+        Cell ids from the start (not included) to the first GOAL or target
+        cell, always stepping to the neighbour closest to the goal.
+        """
+        path = []
+        cell = self.start
+        if max_length is None:
+            max_length = len(self.g)
+        while len(path) < max_length and self._exit_cost(cell) is None:
+            cost, cell = min((1 + self.g[cell + d], cell + d)
+                             for d in self.offsets
+                             if self.value[cell + d] != WALL)
+            if cost == INFINITY:
+                break
+            path.append(cell)
+        if path and self._exit_cost(path[-1]) is not None:
+            self.heading = path[-1]
+        else:
+            # no way to the targets, new ones are picked at the next update
+            self.heading = self.start
+        return path
+
+def cell_path(x, y, grid, state: State, deadline=None):
+    """
+    Drop-in for the path of ``search.a_star_search``: path of window cells on
+    ``grid`` (a ``State.map_window``, the bot stands on (x, y)), kept up to
+    date by a ``DStarLite`` living in the ``State``.
+    """
+    width = state.global_map.shape[1]
+    ox = state.sensor.physics.x + state.map_padding - x
+    oy = state.sensor.physics.y + state.map_padding - y
+    start = (ox + x) * width + oy + y
+    planner = state.incremental_planner
+    if planner is None:
+        tick = time.perf_counter()
+        planner = state.incremental_planner = DStarLite(
+            state.global_map, start,
+            TARGET_DISTANCE * state.sensor.environment.vis_radius)
+        planner.time = time.perf_counter() - tick
+    else:
+        planner.update(state.global_map, start)
+    done = planner.compute(deadline)
+    state.telemetry.note(expansions=planner.expansions,
+                         frontier_peak=planner.frontier_peak,
+                         search_timed_out=not done)
+    if not done:
+        return []
+    path = []
+    for cell in planner.path():
+        cx, cy = divmod(cell, width)
+        cx, cy = cx - ox, cy - oy
+        if not (0 <= cx < grid.shape[0] and 0 <= cy < grid.shape[1]):
+            break
+        path.append((cx, cy))
+    return path
+
+def ponder(state: State, gx, gy, deadline):
+    """
+    Work ahead while waiting for the next observation: repair the plan of the
+    ``DStarLite`` in the ``State`` for the global position (gx, gy) the bot
+    is about to reach, on the map seen so far. Stops at ``deadline``, returns
+    whether the plan is up to date. The next ``cell_path`` carries on from
+    here, whatever the observation turns out to be.
+    """
+    planner = state.incremental_planner
+    if planner is None:
+        return True
+    width = state.global_map.shape[1]
+    start = (gx + state.map_padding) * width + gy + state.map_padding
+    if start != planner.start:
+        planner.update(state.global_map, start)
+    return planner.compute(deadline)
@@ -0,0 +1,199 @@
+import argparse
+import csv
+import dataclasses
+import json
+import multiprocessing
+import re
+import sys
+import numpy as np
+import grid_race_env
+import replay
+
+from typing import NamedTuple, Optional
+
+# The statuses of failed steps, as saved by run.GridRaceEnv
+INVALID_MOVE = re.compile(r'Invalid move: \((-?\d+), (-?\d+)\)\.')
+PENALTY = 'Player is in penalty, skipping their turn.'
+
+# the order of the last axis of ``ReplayArrays.states``
+STATE_FIELDS = [field.name for field in dataclasses.fields(replay.PlayerState)]
+
+FIELDS = [
+    'replay', 'player', 'finished', 'turns_to_finish', 'moves',
+    'invalid_moves', 'penalty_turns', 'mean_speed', 'max_speed', 'distance',
+    'wall_collisions', 'player_collisions'
+]
+
+class ReplayArrays(NamedTuple):
+    """
+    A replay as arrays, one row per state or step: ``states`` is of shape
+    (states, players, 4), the last axis is ``STATE_FIELDS``.
+    """
+    track: np.ndarray
+    turns: np.ndarray
+    states: np.ndarray
+    step_player: np.ndarray
+    step_success: np.ndarray
+    step_status: list[str]
+
+def load_arrays(fname: str) -> ReplayArrays:
+    # read as plain JSON, building the dataclasses of ``replay`` for every
+    # state would take most of the time
+    with open(fname, 'r') as f:
+        obj = json.load(f)
+    num_players = obj['env_info']['num_players']
+    states = np.array([[[p[name] for name in STATE_FIELDS]
+                        for p in state['players']]
+                       for state in obj['states']],
+                      dtype=np.int64).reshape(-1, num_players, 4)
+    steps = obj['steps']
+    return ReplayArrays(
+        track=np.array(obj['env_info']['track']),
+        turns=np.array([state['turn'] for state in obj['states']]),
+        states=states,
+        step_player=np.array([step['player_ind'] for step in steps],
+                             dtype=np.int64),
+        step_success=np.array([step['success'] for step in steps],
+                              dtype=bool),
+        step_status=[step['status'] for step in steps])
+
+def _per_player(players: np.ndarray, num_players: int,
+                weights: Optional[np.ndarray] = None) -> np.ndarray:
+    return np.bincount(players, weights=weights, minlength=num_players)
+
+def player_stats(arrays: ReplayArrays) -> list[dict]:
+    """
+    One dict per player with the ``FIELDS`` but the replay's name. Speeds
+    are the lengths of the velocities after the player's successful moves.
+    """
+    num_players = arrays.states.shape[1]
+    pos = arrays.states[:, :, :2]
+    vel = arrays.states[:, :, 2:]
+    num_steps = len(arrays.step_player)
+    players = arrays.step_player
+    success = arrays.step_success
+
+    # only the player of a step moves
+    distance = np.linalg.norm(np.diff(pos, axis=0), axis=2).sum(axis=0)
+    on_goal = arrays.track[pos[:, :, 0], pos[:, :, 1]] == \
+            grid_race_env.CellType.GOAL.value
+    finished = on_goal.any(axis=0)
+    turns_to_finish = arrays.turns[on_goal.argmax(axis=0)]
+
+    # the state after step ``k`` is ``k + 1``
+    speed = np.linalg.norm(vel[1:num_steps + 1][np.arange(num_steps),
+                                                 players],
+                           axis=1)
+    moves = _per_player(players[success], num_players)
+    speed_sum = _per_player(players[success], num_players, speed[success])
+    max_speed = np.zeros(num_players)
+    np.maximum.at(max_speed, players[success], speed[success])
+
+    penalty = np.array([status == PENALTY for status in arrays.step_status],
+                       dtype=bool)
+    invalid = ~success & ~penalty
+    penalty_turns = _per_player(players[penalty], num_players)
+    invalid_moves = _per_player(players[invalid], num_players)
+
+    # An invalid move either leaves the track or runs into another player
+    # (or is not a valid acceleration at all).
+    traversable = arrays.track >= 0
+    wall_collisions = np.zeros(num_players, dtype=int)
+    player_collisions = np.zeros(num_players, dtype=int)
+    for k in np.flatnonzero(invalid):
+        match = INVALID_MOVE.fullmatch(arrays.step_status[k])
+        if match is None:
+            continue
+        delta = np.array([int(match[1]), int(match[2])])
+        if not np.all(np.isin(delta, [-1, 0, 1])):
+            continue
+        p = players[k]
+        start = pos[k, p]
+        if grid_race_env.valid_line(traversable, start,
+                                    start + vel[k, p] + delta):
+            player_collisions[p] += 1
+        else:
+            wall_collisions[p] += 1
+
+    return [{
+        'player': p,
+        'finished': bool(finished[p]),
+        'turns_to_finish': int(turns_to_finish[p]) if finished[p] else None,
+        'moves': int(moves[p]),
+        'invalid_moves': int(invalid_moves[p]),
+        'penalty_turns': int(penalty_turns[p]),
+        'mean_speed': float(speed_sum[p] / moves[p]) if moves[p] else 0.0,
+        'max_speed': float(max_speed[p]),
+        'distance': float(distance[p]),
+        'wall_collisions': int(wall_collisions[p]),
+        'player_collisions': int(player_collisions[p]),
+    } for p in range(num_players)]
+
+def analyse_file(fname: str) -> list[dict]:
+    # a broken file does not stop the others
+    try:
+        stats = player_stats(load_arrays(fname))
+    except Exception as e:
+        print(f'Error: cannot analyse {fname}: {e}', file=sys.stderr)
+        return []
+    return [{'replay': fname, **row} for row in stats]
+
+def analyse_files(fnames: list[str], processes: Optional[int] = None):
+    # the rows of every file, in the order of the files
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    chunksize = max(1, len(fnames) // (4 * processes))
+    with multiprocessing.Pool(processes) as pool:
+        for rows in pool.imap(analyse_file, fnames, chunksize):
+            yield from rows
+
+def write_csv(rows, output) -> None:
+    writer = csv.DictWriter(output, fieldnames=FIELDS)
+    writer.writeheader()
+    writer.writerows(rows)
+
+def write_json(rows, output) -> None:
+    json.dump(list(rows), output, indent=1)
+    output.write('\n')
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description='Per player statistics of replays saved by the judge: '
+        'turns to finish, invalid moves, penalty turns, speed, distance '
+        'travelled and collisions. One row per replay and player.')
+    parser.add_argument('replays', nargs='+', help='Replay files.')
+    parser.add_argument(
+        '--output',
+        type=str,
+        default=None,
+        help='File to write the summary to. Default is the standard output.')
+    parser.add_argument(
+        '--format',
+        choices=['csv', 'json'],
+        default=None,
+        help='Format of the summary. Default is JSON if the output file ends '
+        'with .json, CSV otherwise.')
+    parser.add_argument(
+        '--processes',
+        type=int,
+        default=None,
+        help='Number of replays analysed at the same time. Default is the '
+        'number of CPUs.')
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    fmt = args.format
+    if fmt is None:
+        fmt = 'json' if args.output and args.output.endswith('.json') \
+                else 'csv'
+    write = write_json if fmt == 'json' else write_csv
+    rows = analyse_files(args.replays, args.processes)
+    if args.output is None:
+        write(rows, sys.stdout)
+    else:
+        with open(args.output, 'w', newline='') as f:
+            write(rows, f)
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,8 @@
 import enum
 import itertools
+import math
 import sys
 import numpy as np
-import PIL.Image as Image
 
 from typing import Optional, NamedTuple
 
@@ -100,12 +100,55 @@ class RandomPlayer(AiPlayer):
 # 1}}} #
 
 # Circuit {{{1 #
+def valid_line(traversable: np.ndarray, pos1, pos2) -> bool:
+    """
+    Whether a player can move from ``pos1`` to ``pos2`` in a straight line.
+    ``traversable`` is a boolean array over the track cells.
+
+    The bots import this as well, so they follow the same rules as the judge.
+    """
+    x1, y1 = int(pos1[0]), int(pos1[1])
+    x2, y2 = int(pos2[0]), int(pos2[1])
+    height, width = traversable.shape
+    if (min(x1, y1, x2, y2) < 0 or max(x1, x2) >= height
+            or max(y1, y2) >= width):
+        return False
+    diff_x = x2 - x1
+    diff_y = y2 - y1
+    # Go through the straight line connecting ``pos1`` and ``pos2``
+    # cell-by-cell. Wall is blocking if either it is straight in the way or
+    # there are two wall cells above/below each other and the line would go
+    # "through" them.
+    if diff_x != 0:
+        slope = diff_y / diff_x
+        d = 1 if diff_x > 0 else -1  # direction: left or right
+        for i in range(abs(diff_x) + 1):
+            x = x1 + i*d
+            y = y1 + i*slope*d
+            if (not traversable[x, math.ceil(y)]
+                    and not traversable[x, math.floor(y)]):
+                return False
+    # Do the same, but examine two-cell-wall configurations when they are
+    # side-by-side (east-west).
+    if diff_y != 0:
+        slope = diff_x / diff_y
+        d = 1 if diff_y > 0 else -1  # direction: up or down
+        for i in range(abs(diff_y) + 1):
+            x = x1 + i*slope*d
+            y = y1 + i*d
+            if (not traversable[math.ceil(x), y]
+                    and not traversable[math.floor(x), y]):
+                return False
+    return True
+
 class Circuit:
 
     def __init__(self) -> None:
         self.players: list[Player] = []
         self.track, self.start = self.initialise_track()
         self.track.flags.writeable = False
+        self.traversable = np.vectorize(lambda c: c.traversable())(self.track)
+        self.traversable.flags.writeable = False
         # ``laps`` is not actually used anywhere
         # self.laps: int = params['laps']
         assert np.all(
@@ -169,40 +212,7 @@ class Circuit:
             p.vel[()] = [0, 0]
 
     def valid_line(self, pos1, pos2) -> bool:
-        if (np.any(pos1 < 0) or np.any(pos2 < 0)
-                or np.any(pos1 >= self.track.shape)
-                or np.any(pos2 >= self.track.shape)):
-            return False
-        diff = pos2 - pos1
-        # Go through the straight line connecting ``pos1`` and ``pos2``
-        # cell-by-cell. Wall is blocking if either it is straight in the way or
-        # there are two wall cells above/below each other and the line would go
-        # "through" them.
-        if diff[0] != 0:
-            slope = diff[1] / diff[0]
-            d = np.sign(diff[0])  # direction: left or right
-            for i in range(abs(diff[0]) + 1):
-                x = pos1[0] + i*d
-                y = pos1[1] + i*slope*d
-                y_ceil = np.ceil(y).astype(int)
-                y_floor = np.floor(y).astype(int)
-                if (not self.track[x, y_ceil].traversable()
-                        and not self.track[x, y_floor].traversable()):
-                    return False
-        # Do the same, but examine two-cell-wall configurations when they are
-        # side-by-side (east-west).
-        if diff[1] != 0:
-            slope = diff[0] / diff[1]
-            d = np.sign(diff[1])  # direction: up or down
-            for i in range(abs(diff[1]) + 1):
-                x = pos1[0] + i*slope*d
-                y = pos1[1] + i*d
-                x_ceil = np.ceil(x).astype(int)
-                x_floor = np.floor(x).astype(int)
-                if (not self.track[x_ceil, y].traversable()
-                        and not self.track[x_floor, y].traversable()):
-                    return False
-        return True
+        return valid_line(self.traversable, pos1, pos2)
 
     def iter_players(self):
         players = itertools.cycle(self.players)
@@ -267,6 +277,8 @@ class PlayableMap(Circuit):
         return track, start
 
 def load_track_from_file(fname: str) -> Circuit:
+    # the bots import this module too, they have no use for PIL
+    import PIL.Image as Image
     img = Image.open(fname)
     if img.mode != 'RGB':
         img = img.convert('RGB')
@@ -297,4 +309,49 @@ def load_track_from_file(fname: str) -> Circuit:
 
 # 1}}} #
 
+# SpatialHash {{{1 #
+class SpatialHash:
+    """
+    Grid index of player positions. Players are put into square buckets of
+    ``bucket_size`` cells, so everyone within ``bucket_size`` distance of a
+    position is found in the 3x3 neighbouring buckets.
+    """
+
+    def __init__(self, bucket_size: int):
+        self.bucket_size = max(1, bucket_size)
+        self._buckets: dict[tuple[int, int], set[int]] = {}
+        self._keys: dict[int, tuple[int, int]] = {}
+
+    def _key(self, pos) -> tuple[int, int]:
+        return (int(pos[0]) // self.bucket_size,
+                int(pos[1]) // self.bucket_size)
+
+    def clear(self) -> None:
+        self._buckets.clear()
+        self._keys.clear()
+
+    def update(self, ind: int, pos) -> None:
+        key = self._key(pos)
+        old_key = self._keys.get(ind)
+        if old_key == key:
+            return
+        if old_key is not None:
+            self._buckets[old_key].discard(ind)
+        self._buckets.setdefault(key, set()).add(ind)
+        self._keys[ind] = key
+
+    def candidates(self, pos) -> list[int]:
+        """
+        Indices of the players in the buckets around ``pos``, a superset of
+        the players within ``bucket_size`` distance.
+        """
+        kx, ky = self._key(pos)
+        found = []
+        for bx in range(kx - 1, kx + 2):
+            for by in range(ky - 1, ky + 2):
+                found.extend(self._buckets.get((bx, by), ()))
+        return found
+
+# 1}}} #
+
 # vim:set et sw=4 ts=4 fdm=marker:
@@ -1,3 +1,4 @@
+import asyncio
 import socket
 import json
 import struct
@@ -16,11 +17,15 @@ JUDGE_PORT = 10000
 class NetworkError(Exception):
     pass
 
-def send_msg(sock: socket.SocketType, msg: Jsonable) -> None:
+def encode_msg(msg: Jsonable) -> bytes:
+    # the message as sent, preceded by its length
     msg = json.dumps(msg, ensure_ascii=True).encode('ascii')
     msg_len = len(msg)
     msg_len = struct.pack('>i', msg_len)
-    sock.sendall(msg_len + msg)
+    return msg_len + msg
+
+def send_msg(sock: socket.SocketType, msg: Jsonable) -> None:
+    sock.sendall(encode_msg(msg))
 
 def recv_msg(sock: socket.SocketType) -> Jsonable:
 
@@ -49,4 +54,21 @@ def send_data(sock: socket.SocketType, data: str) -> None:
     except (BrokenPipeError, OSError) as e:
         raise NetworkError('Failed to send data') from e
 
+async def recv_msg_async(reader: asyncio.StreamReader) -> Jsonable:
+    # ``recv_msg`` on an asyncio stream
+    try:
+        msg_len, = struct.unpack('>i', await reader.readexactly(4))
+        msg = await reader.readexactly(msg_len)
+    except (asyncio.IncompleteReadError, ConnectionResetError) as e:
+        raise NetworkError('Socket is broken.') from e
+    return json.loads(msg)
+
+async def send_data_async(writer: asyncio.StreamWriter, data: str) -> None:
+    # ``send_data`` on an asyncio stream
+    try:
+        writer.write(encode_msg({'type': 'data', 'data': data}))
+        await writer.drain()
+    except (BrokenPipeError, OSError) as e:
+        raise NetworkError('Failed to send data') from e
+
 # May want to send control messages as well, such as request for shutdown/kill
@@ -1,5 +1,7 @@
 import json
+import os
 import dataclasses
+import functools
 import numpy as np
 import typing
 
@@ -44,10 +46,14 @@ class Replay:
     """
     ``states`` contain the states before and after each step, ``steps`` contain
     the plys or steps the players made. So ``len(states) = len(steps) + 1``.
+    ``turns`` is the turn of the last state, saved ahead of the (much longer)
+    states, so readers know it before getting to them. It is None in replays
+    saved before it was added.
     """
     env_info: EnvInfo
-    states: list[State] = dataclasses.field(default_factory=list)
+    turns: Optional[int] = None
     steps: list[PlayerStep] = dataclasses.field(default_factory=list)
+    states: list[State] = dataclasses.field(default_factory=list)
     version: int = 1
 
 class Encoder(json.JSONEncoder):
@@ -70,6 +76,11 @@ def serialise(replay: Replay, output) -> None:
     else:
         json.dump(replay, output, cls=Encoder)
 
+@functools.cache
+def _field_types(target_cls: type) -> dict[str, type]:
+    # looked up once per class, not once per object
+    return typing.get_type_hints(target_cls)
+
 def _construct_dataclass(target_cls: type, obj: dict[str] | Any):
     # Note: this (whole function) only works if the dataclasses are not
     # subclassed
@@ -77,9 +88,13 @@ def _construct_dataclass(target_cls: type, obj: dict[str] | Any):
     generic_cls = typing.get_origin(target_cls)
     assert generic_cls not in [dict, tuple], f'{generic_cls} is not supported'
     if generic_cls == list:
+        element_cls = typing.get_args(target_cls)[0]
+        if (typing.get_origin(element_cls) is None
+                and not dataclasses.is_dataclass(element_cls)):
+            # leaves are converted in one go, a track has millions of them
+            return target_cls(map(element_cls, obj))
         return target_cls(
-            _construct_dataclass(typing.get_args(target_cls)[0], elem)
-            for elem in obj)
+            _construct_dataclass(element_cls, elem) for elem in obj)
     if generic_cls == Optional or generic_cls == typing.Union:
         concrete_clss = typing.get_args(target_cls)
         assert (not dataclasses.is_dataclass(concrete_clss[0])
@@ -97,7 +112,7 @@ def _construct_dataclass(target_cls: type, obj: dict[str] | Any):
         return target_cls(obj)
     assert typing.get_origin(target_cls) != tuple, \
         'Tuples are not supported for deserialisation'
-    fields = typing.get_type_hints(target_cls)
+    fields = _field_types(target_cls)
     typed_obj = {k: _construct_dataclass(fields[k], v) for k, v in obj.items()}
     return target_cls(**typed_obj)
 
@@ -105,3 +120,95 @@ def deserialise(fname: str) -> Replay:
     with open(fname, 'r') as f:
         obj_dict = json.load(f)
     return _construct_dataclass(Replay, obj_dict)
+
+class ReplayStream:
+    """
+    Reads a replay file piece by piece: iterating yields ``(field, value)``
+    pairs in the order of the file, for list fields (``states`` and
+    ``steps``) one pair per element. ``progress`` is the part of the file
+    read so far, from 0 to 1.
+    """
+
+    def __init__(self, fname: str, chunk_size: int = 1 << 16):
+        self.fname = fname
+        self.chunk_size = chunk_size
+        self.size = os.path.getsize(fname)
+        self.read = 0
+        self._decoder = json.JSONDecoder()
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+
+    @property
+    def progress(self) -> float:
+        return self.read / self.size if self.size else 1.0
+
+    def _fill(self, f, size: Optional[int] = None) -> None:
+        chunk = f.read(self.chunk_size if size is None else size)
+        self.read += len(chunk)
+        self._eof = not chunk
+        self._buffer = self._buffer[self._pos:] + chunk
+        self._pos = 0
+
+    def _peek(self, f) -> str:
+        # the next non-whitespace character, '' at the end of the file
+        while True:
+            while (self._pos < len(self._buffer)
+                   and self._buffer[self._pos].isspace()):
+                self._pos += 1
+            if self._pos < len(self._buffer) or self._eof:
+                return self._buffer[self._pos:self._pos + 1]
+            self._fill(f)
+
+    def _expect(self, f, chars: str) -> str:
+        c = self._peek(f)
+        if not c or c not in chars:
+            raise ValueError(f'Expected one of {chars!r} at position '
+                             f'{self.read - len(self._buffer) + self._pos} '
+                             f'of {self.fname}, got {c!r}')
+        self._pos += 1
+        return c
+
+    def _value(self, f):
+        # A number may go on in the next chunk, so what ends at the end of
+        # the buffer is decoded again with more. The more is as much as what
+        # is left in the buffer, so a large value is decoded a few times, not
+        # once per chunk.
+        self._peek(f)
+        while True:
+            try:
+                obj, end = self._decoder.raw_decode(self._buffer, self._pos)
+                if end < len(self._buffer) or self._eof:
+                    self._pos = end
+                    return obj
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            self._fill(f, max(self.chunk_size, len(self._buffer) - self._pos))
+
+    def __iter__(self) -> typing.Iterator[tuple[str, Any]]:
+        fields = _field_types(Replay)
+        with open(self.fname, 'r') as f:
+            self._expect(f, '{')
+            if self._peek(f) == '}':
+                return
+            while True:
+                name = self._value(f)
+                self._expect(f, ':')
+                target_cls = fields[name]
+                if typing.get_origin(target_cls) == list:
+                    element_cls = typing.get_args(target_cls)[0]
+                    self._expect(f, '[')
+                    if self._peek(f) == ']':
+                        self._pos += 1
+                    else:
+                        while True:
+                            yield name, _construct_dataclass(
+                                element_cls, self._value(f))
+                            if self._expect(f, ',]') == ']':
+                                break
+                else:
+                    yield name, _construct_dataclass(target_cls,
+                                                     self._value(f))
+                if self._expect(f, ',}') == '}':
+                    return
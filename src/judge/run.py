@@ -1,4 +1,6 @@
+import dataclasses
 import itertools
+import math
 import numpy as np
 import grid_race_env
 import judge
@@ -14,13 +16,22 @@ class GridRaceEnv(judge.EnvironmentBase):
                  num_players: int,
                  visibility_radius: int,
                  circuit: grid_race_env.Circuit,
-                 max_turns: int = 500):
+                 max_turns: int = 500,
+                 filter_players: bool = False,
+                 stall_turns: Optional[int] = None):
         self._num_players = num_players
         self.max_turns = max_turns
+        # end the game if none of the players still racing has moved in this
+        # many turns
+        self.stall_turns = stall_turns
         self.visibility_radius = visibility_radius
+        # only send the positions of the players within the visibility radius
+        self.filter_players = filter_players
+        self.player_index = grid_race_env.SpatialHash(visibility_radius)
         self.circuit = circuit
         for _ in range(num_players):
             self.circuit.add_new_player()
+        self._encode_track()
 
     def reset(self) -> str:
         self.circuit.reset_players()
@@ -28,6 +39,8 @@ class GridRaceEnv(judge.EnvironmentBase):
         self.scores = [self.max_turns + 1] * self.num_players
         self.turns = 0
         self.penalties = [None for _ in range(self.num_players)]
+        # the turn when each player's position last changed
+        self.last_moved = [0] * self.num_players
         # extra player signalling end of turn
         self.players_iterator = itertools.cycle(range(self.num_players + 1))
         to_int = np.vectorize(lambda c: c.value)
@@ -38,8 +51,17 @@ class GridRaceEnv(judge.EnvironmentBase):
             states=[],
             steps=[])
         self.replay.states.append(self._save_state())
-        return (f'{self.circuit.shape[0]} {self.circuit.shape[1]} '
-                f'{self.num_players} {self.visibility_radius}')
+        self.player_index.clear()
+        for p in self.circuit.players:
+            self.player_index.update(p.ind, p.pos)
+        # the last observation of each player and what it depended on
+        self._observations = [(None, None)] * self.num_players
+        initial_obs = (f'{self.circuit.shape[0]} {self.circuit.shape[1]} '
+                       f'{self.num_players} {self.visibility_radius}')
+        if self.filter_players:
+            # signals that the player list is preceded by its length
+            initial_obs += ' 1'
+        return initial_obs
 
     def _save_step(self, step: replay.PlayerStep) -> None:
         """
@@ -73,6 +95,10 @@ class GridRaceEnv(judge.EnvironmentBase):
                     if self.turns >= self.max_turns:
                         print(f'Reached max turn limit ({self.turns}).')
                         return None
+                    if self._stalled():
+                        print(f'No player has moved in {self.stall_turns} '
+                              f'turns, ending at turn {self.turns}.')
+                        return None
                     # skip the sentinel player indicating turn's end
                     continue
                 if self.circuit.player_won(next_player):
@@ -105,6 +131,62 @@ class GridRaceEnv(judge.EnvironmentBase):
             else:
                 return next_player
 
+    def _stalled(self) -> bool:
+        """
+        Whether every player still racing has stood in the same place for
+        ``stall_turns`` turns. Invalid moves stop a player where they are, so
+        this includes bots repeating invalid moves through their penalties.
+        False once nobody is racing: the game then ends as usual.
+        """
+        if self.stall_turns is None:
+            return False
+        racing = [i for i in range(self.num_players)
+                  if not self.circuit.player_won(i)]
+        return bool(racing) and all(
+            self.turns - self.last_moved[i] >= self.stall_turns
+            for i in racing)
+
+    def _encode_track(self) -> None:
+        """
+        Prepares the text of the track for ``observation``: every row of the
+        track, padded with walls by the visibility radius on each side, as
+        the space separated cell values, and where each cell starts in it. A
+        row of the window is then a slice of it between the fog, which is the
+        same for every window.
+        """
+        radius = self.visibility_radius
+        track = np.vectorize(lambda c: c.value)(self.circuit.track)
+        track = np.pad(track, radius,
+                       constant_values=grid_race_env.CellType.WALL.value)
+        self._track_rows = [' '.join(map(str, line)) for line in track.tolist()]
+        # one more column, as if the rows ended in a space
+        lengths = np.zeros(track.shape, dtype=np.int32)
+        for cell in grid_race_env.CellType:
+            lengths[track == cell.value] = len(str(cell.value)) + 1
+        self._cell_starts = np.zeros((track.shape[0], track.shape[1] + 1),
+                                     dtype=np.int32)
+        np.cumsum(lengths, axis=1, out=self._cell_starts[:, 1:])
+        # the visible cells of each row of the window are between ``first``
+        # and ``last``
+        not_visible = str(grid_race_env.CellType.NOT_VISIBLE.value)
+        self._fog = []
+        for dx in range(-radius, radius + 1):
+            half_width = math.isqrt(radius**2 - dx**2)
+            hidden = radius - half_width
+            self._fog.append((hidden, radius + half_width,
+                              (not_visible + ' ') * hidden,
+                              (' ' + not_visible) * hidden))
+
+    def _local_map(self, pos: grid_race_env.Position) -> str:
+        # with the padding, the window starts at ``pos`` in the padded track
+        x, y = int(pos[0]), int(pos[1])
+        lines = []
+        for r, (first, last, left, right) in enumerate(self._fog):
+            start = self._cell_starts[x + r, y + first]
+            end = self._cell_starts[x + r, y + last + 1] - 1
+            lines.append(left + self._track_rows[x + r][start:end] + right)
+        return '\n'.join(lines)
+
     def observation(self, current_player: int) -> str:
         """
         Observation to be sent to the current player
@@ -113,31 +195,43 @@ class GridRaceEnv(judge.EnvironmentBase):
         "\n"s. The final newline will be appended.
         """
         current_player_obj = self.circuit.players[current_player]
-        local_map = np.zeros(
-            (2 * self.visibility_radius + 1, 2 * self.visibility_radius + 1),
-            dtype=int)
-        for r in range(2 * self.visibility_radius + 1):
-            for c in range(2 * self.visibility_radius + 1):
-                x = current_player_obj.pos[0] + r - self.visibility_radius
-                y = current_player_obj.pos[1] + c - self.visibility_radius
-                if (np.linalg.norm(
-                        np.array([x, y]) - current_player_obj.pos, ord=2)
-                        > self.visibility_radius):
-                    local_map[r, c] = grid_race_env.CellType.NOT_VISIBLE.value
-                elif (not (0 <= x < self.circuit.shape[0])
-                      or not (0 <= y < self.circuit.shape[1])):
-                    local_map[r, c] = grid_race_env.CellType.WALL.value
-                else:
-                    local_map[r, c] = self.circuit.track[x, y].value
-        # TODO check this
-        local_map_str = '\n'.join(
-            ' '.join(map(str, line)) for line in local_map)
-        player_pos = [f'{p.pos[0]} {p.pos[1]}' for p in self.circuit.players]
+        # the same as last time if nobody moved and the velocity is the same
+        key = (current_player_obj.vel.tolist(),
+               [p.pos.tolist() for p in self.circuit.players])
+        last_key, last_obs = self._observations[current_player]
+        if key == last_key:
+            return last_obs
+        local_map_str = self._local_map(current_player_obj.pos)
+        if self.filter_players:
+            visible_players = self._visible_players(current_player_obj.pos)
+            player_pos = [str(len(visible_players))]
+        else:
+            visible_players = self.circuit.players
+            player_pos = []
+        player_pos += [f'{p.pos[0]} {p.pos[1]}' for p in visible_players]
         current_player_info = (
             f'{current_player_obj.pos[0]} {current_player_obj.pos[1]} '
             f'{current_player_obj.vel[0]} {current_player_obj.vel[1]}')
-        return (current_player_info + '\n' + '\n'.join(player_pos) + '\n'
-                + local_map_str)
+        obs = (current_player_info + '\n' + '\n'.join(player_pos) + '\n'
+               + local_map_str)
+        self._observations[current_player] = key, obs
+        return obs
+
+    def _visible_players(
+            self, pos: grid_race_env.Position) -> list[grid_race_env.Player]:
+        """
+        Players within the visibility radius of ``pos`` (including the one
+        standing there), in the order of their indices.
+        """
+        radius_sq = self.visibility_radius**2
+        visible = []
+        for ind in sorted(self.player_index.candidates(pos)):
+            p = self.circuit.players[ind]
+            dx = int(p.pos[0]) - int(pos[0])
+            dy = int(p.pos[1]) - int(pos[1])
+            if dx * dx + dy * dy <= radius_sq:
+                visible.append(p)
+        return visible
 
     def read_player_input(
             self, read_line: Callable[[], str]) -> Optional[judge.PlayerInput]:
@@ -183,6 +277,7 @@ class GridRaceEnv(judge.EnvironmentBase):
         """
         dx, dy = player_input
         assert not self.circuit.player_won(current_player)
+        old_pos = self.circuit.players[current_player].pos.copy()
         try:
             self.circuit.move_player(current_player, np.array([dx, dy]))
             player_step = replay.PlayerStep(
@@ -195,6 +290,10 @@ class GridRaceEnv(judge.EnvironmentBase):
                 current_player,
                 success=False,
                 status=f'Invalid move: ({dx}, {dy}).')
+        new_pos = self.circuit.players[current_player].pos
+        self.player_index.update(current_player, new_pos)
+        if np.any(new_pos != old_pos):
+            self.last_moved[current_player] = self.turns
         if self.circuit.player_won(current_player):
             self.scores[current_player] = self.turns
         self._save_step(player_step)
@@ -214,12 +313,17 @@ def run_judge():
     options = app.options
     circuit = grid_race_env.load_track_from_file(options['track_file'])
     env = GridRaceEnv(options['num_players'], options['visibility_radius'],
-                      circuit, options['max_turns'])
+                      circuit, options['max_turns'],
+                      options.get('filter_players', False),
+                      options.get('stall_turns'))
     scores = app.run_environment(env)
     print('Final scores:', scores)
     if app.create_replay:
+        # the turn count goes at the front, for the viewer
+        history = dataclasses.replace(env.replay,
+                                      turns=env.replay.states[-1].turn)
         with app.replay_file() as f:
-            replay.serialise(env.replay, f)
+            replay.serialise(history, f)
     app.write_output(scores)
 
 if __name__ == "__main__":
@@ -1,31 +1,164 @@
-from protocol import Protocol
+import argparse
+import asyncio
+import time
+from protocol import Protocol, AsyncProtocol
 from sensor import *
-from search import choose_action
+from search import choose_action, turn_deadline
+import incremental_search
 import numpy as np
 from state import *
-from pprint import pprint
-from colored_map import generate_colored_map
+from telemetry import Telemetry
+from f_score_history import FScoreHistory, FScoreStore
 
+# Pondering runs in slices this long (seconds), between them the runtime
+# checks whether the next observation has arrived
+PONDER_SLICE = 0.01
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='The ai-racer bot.')
+    parser.add_argument(
+        '--telemetry',
+        type=str,
+        default=None,
+        help='Record what the planner does each turn, and save it to this '
+        'file (JSON lines) at the end of the game or on SIGUSR1.')
+    parser.add_argument(
+        '--telemetry_size',
+        type=int,
+        default=1000,
+        help='Number of the last turns kept in the telemetry. Default is 1000.')
+    parser.add_argument(
+        '--f_maps',
+        type=str,
+        default=None,
+        help='Save the f-score field of every turn to this directory, a '
+        'compressed .npz file per turn.')
+    parser.add_argument(
+        '--f_map_depth',
+        type=int,
+        default=16,
+        help='Number of the last f-score fields kept in memory. Default is 16.')
+    parser.add_argument(
+        '--f_map_turn',
+        type=int,
+        default=3,
+        help='Index of the f-score field drawn to map4.png at the end. '
+        'Default is 3.')
+    parser.add_argument(
+        '--step_timeout',
+        type=float,
+        default=STEP_TIMEOUT,
+        help='Time limit of a turn in seconds, the judge\'s --timeout. '
+        'Default is 1.0.')
+    parser.add_argument(
+        '--safety_margin',
+        type=float,
+        default=SAFETY_MARGIN,
+        help='Part of the time limit in seconds kept for sending the answer '
+        'and for the judge\'s overhead. Default is 0.3.')
+    parser.add_argument(
+        '--asynchronous',
+        action='store_true',
+        help='Run on asyncio. With the incremental planner, it keeps working '
+        'on the next turn while the other players move.')
+    parser.add_argument(
+        '--planner',
+        choices=['a_star', 'incremental'],
+        default=None,
+        help='Cell path planner: a_star searches the window from scratch '
+        'every turn, incremental repairs a D* Lite search over the map seen '
+        'so far. Default is incremental with --asynchronous, a_star '
+        'otherwise.')
+    args = parser.parse_args()
+    if args.step_timeout <= args.safety_margin:
+        parser.error('--step_timeout has to be longer than --safety_margin.')
+    if args.planner is None:
+        args.planner = 'incremental' if args.asynchronous else 'a_star'
+    return args
+
+def start_game(sensor: Sensor, args: argparse.Namespace) -> State:
+    telemetry = Telemetry(args.telemetry_size, enabled=bool(args.telemetry))
+    if args.telemetry:
+        telemetry.dump_on_signal(args.telemetry)
+    store = FScoreStore(args.f_maps) if args.f_maps else None
+    f_maps = FScoreHistory(args.f_map_depth, store, pinned=[args.f_map_turn])
+    return State(sensor, telemetry=telemetry, f_maps=f_maps,
+                 turn_budget=args.step_timeout - args.safety_margin)
+
+def end_game(state: State, args: argparse.Namespace):
+    print(state.visited_cells())
+    if args.telemetry:
+        state.telemetry.dump(args.telemetry)
+    state.f_maps.close()
+    f_map = state.f_maps.get(args.f_map_turn)
+    if f_map is not None:
+        # matplotlib takes long to import, it is not needed before the end
+        from colored_map import generate_colored_map
+        generate_colored_map(f_map, f_map.shape, "map4.png")
 
 def main():
+    args = parse_args()
+    if args.asynchronous:
+        asyncio.run(async_main(args))
+        return
     p = Protocol("localhost", 10000)
     p.Connect()
     sensor = Sensor(p.GetData())
-    state = State(sensor)
+    state = start_game(sensor, args)
     
     while True:
-        if not sensor.Sense(str(p.GetData())):
+        data = p.GetData()
+        deadline = turn_deadline(state)
+        if not sensor.Sense(data):
             break
         
-        action = choose_action(sensor.environment.vis_radius, sensor.environment.vis_radius,
+        state.update_map(sensor.vision.grid)
+        action = choose_action(state.plan_radius, state.plan_radius,
                                sensor.physics.vx, sensor.physics.vy,
-                               np.array(sensor.vision.grid), state)
+                               state.map_window(state.plan_radius), state, deadline,
+                               planner=args.planner)
         state.add_global(sensor.physics.x, sensor.physics.y)
         
         p.SendData(f'{action[0]} {action[1]}\n')
-        print(f'{action[0]} {action[1]}')
+        state.telemetry.end_turn()
+
+    end_game(state, args)
+
+async def async_main(args: argparse.Namespace):
+    p = AsyncProtocol("localhost", 10000)
+    await p.Connect()
+    sensor = Sensor(await p.GetData())
+    state = start_game(sensor, args)
+    next_data = asyncio.create_task(p.GetData())
+    # global position the last move leads to
+    heading = None
+
+    while True:
+        # ponder until the observation arrives or there is nothing left to do
+        while heading is not None and not next_data.done():
+            if incremental_search.ponder(state, *heading,
+                                         time.perf_counter() + PONDER_SLICE):
+                break
+            await asyncio.sleep(0)
+        data = await next_data
+        deadline = turn_deadline(state)
+        if not sensor.Sense(data):
+            break
+
+        state.update_map(sensor.vision.grid)
+        action = choose_action(state.plan_radius, state.plan_radius,
+                               sensor.physics.vx, sensor.physics.vy,
+                               state.map_window(state.plan_radius), state,
+                               deadline, planner=args.planner)
+        state.add_global(sensor.physics.x, sensor.physics.y)
+
+        await p.SendData(f'{action[0]} {action[1]}\n')
+        next_data = asyncio.create_task(p.GetData())
+        state.telemetry.end_turn()
+        heading = state.to_global(sensor.physics.vx + action[0],
+                                  sensor.physics.vy + action[1])
+
+    end_game(state, args)
 
-    print(state.player_global_visited)
-    generate_colored_map(state.f_maps[3], (2 * sensor.environment.vis_radius + 1, 2* sensor.environment.vis_radius + 1), "map4.png")
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,5 +1,13 @@
-from judge.network import *
+from judge.network import (recv_msg, send_data, recv_msg_async,
+                           send_data_async)
+import asyncio
 import socket
+import time
+
+# Waiting between connection attempts starts from this (seconds) and doubles
+# up to the maximum, the judge may not be listening yet
+CONNECT_DELAY = 0.05
+MAX_CONNECT_DELAY = 1.0
 
 class Protocol:
     def __init__(self, addr: str, port: int):
@@ -14,16 +22,51 @@ class Protocol:
     def Connect(self):
         self.running = True
         print(f'Trying to connect to {self.addr}:{self.port}')
+        delay = CONNECT_DELAY
         while self.running:
             try:
                 self.socket.connect((self.addr, self.port))
                 print(f'Connected to {self.addr}:{self.port}')
                 self.running = False
             except Exception as e:
-                continue
+                # a socket is not reused after a failed connect
+                self.socket.close()
+                self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                time.sleep(delay)
+                delay = min(2 * delay, MAX_CONNECT_DELAY)
     def GetData(self):
         return recv_msg(self.socket)["data"]
     def SendData(self, data: str):
         send_data(self.socket, data)
-    
-    
\ No newline at end of file
+
+class AsyncProtocol:
+    """
+    ``Protocol`` for asyncio: the same messages, but waiting for them leaves
+    the event loop free for other work.
+    """
+    def __init__(self, addr: str, port: int):
+        self.addr = addr
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    def __del__(self):
+        if self.writer is not None:
+            self.writer.close()
+
+    async def Connect(self):
+        print(f'Trying to connect to {self.addr}:{self.port}')
+        delay = CONNECT_DELAY
+        while True:
+            try:
+                self.reader, self.writer = await asyncio.open_connection(
+                    self.addr, self.port)
+                print(f'Connected to {self.addr}:{self.port}')
+                return
+            except OSError:
+                await asyncio.sleep(delay)
+                delay = min(2 * delay, MAX_CONNECT_DELAY)
+    async def GetData(self):
+        return (await recv_msg_async(self.reader))["data"]
+    async def SendData(self, data: str):
+        await send_data_async(self.writer, data)
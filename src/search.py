@@ -2,6 +2,14 @@ import numpy as np
 from collections import deque
 from state import *
 import heapq
+import time
+import velocity_search
+import incremental_search
+
+def turn_deadline(state: State, turn_start=None):
+    if turn_start is None:
+        turn_start = time.perf_counter()
+    return turn_start + state.turn_budget
 
 
 def is_valid_position(x, y, grid):
@@ -44,7 +52,6 @@ def determine_acceleration(target_x, target_y, x, y, vx, vy, state: State):
     
     lax, lay = state.player_last_acc
     if lax == -1 * ax and lay == -1 * ay:
-        print(f'{lax}, {lay}, {ax}, {ay}')
         ax *= -1
         ay *= -1
     
@@ -81,65 +88,159 @@ def heuristic(x, y, grid, state: State, start):
     return priority
 
 
-def a_star_search(grid, start, state: State):
+# The order decides between equally good paths, keep it fixed
+NEIGHBOUR_OFFSETS = ((-1, 0), (1, 0), (0, -1), (0, 1))
+
+class SearchBuffers:
+    """
+    Flat arrays over the cells of a window, indexed by cell id
+    ``x * width + y``. Allocated once per window shape and reused by
+    ``a_star_search`` every turn.
+    """
+    def __init__(self, shape):
+        self.shape = shape
+        height, width = shape
+        size = height * width
+        # -1 marks cells not reached yet
+        self.g = np.empty(size, dtype=np.int32)
+        self.parent = np.empty(size, dtype=np.int32)
+        # the g score a cell had when it was expanded, -1 if never
+        self.closed = np.empty(size, dtype=np.int32)
+        self.heur = np.empty(size)
+        self.f = np.empty(size)
+        self._g = memoryview(self.g)
+        self._parent = memoryview(self.parent)
+        self._closed = memoryview(self.closed)
+        self._heur = memoryview(self.heur)
+        self._f = memoryview(self.f)
+        # ids of the in-window neighbours of every cell
+        xs, ys = np.divmod(np.arange(size), width)
+        columns = []
+        for dx, dy in NEIGHBOUR_OFFSETS:
+            nx, ny = xs + dx, ys + dy
+            inside = (0 <= nx) & (nx < height) & (0 <= ny) & (ny < width)
+            columns.append(np.where(inside, nx * width + ny, -1))
+        self.neighbours = [[n for n in row if n >= 0]
+                           for row in np.stack(columns, axis=1).tolist()]
+
+    def reset(self):
+        self.g.fill(-1)
+        self.parent.fill(-1)
+        self.closed.fill(-1)
+        self.heur.fill(np.nan)
+        self.f.fill(np.nan)
+
+    def path_to(self, cell):
+        width = self.shape[1]
+        path = []
+        while self._parent[cell] >= 0:
+            path.append(divmod(cell, width))
+            cell = self._parent[cell]
+        path.reverse()
+        return path
+
+    def to_dict(self, values):
+        cells = np.flatnonzero(~np.isnan(values))
+        xs, ys = np.divmod(cells, self.shape[1])
+        return dict(zip(zip(xs.tolist(), ys.tolist()), values[cells].tolist()))
+
+def get_search_buffers(state: State, shape):
+    if state.search_buffers is None or state.search_buffers.shape != shape:
+        state.search_buffers = SearchBuffers(shape)
+    return state.search_buffers
+
+def heuristic_field(grid, visited):
+    # ``heuristic`` of every window cell at once: the cell's own visited
+    # penalty plus what each of its in-window neighbours adds
+    term = np.where(visited, -20., 0.)
+    term += np.where(grid == NOT_VISIBLE, 1., 0.)
+    term += np.where(grid == EMPTY, .5, 0.)
+    padded = np.pad(term, 1)
+    height, width = grid.shape
+    field = np.where(visited, -20., 0.)
+    for dx, dy in NEIGHBOUR_OFFSETS:
+        field += padded[1 + dx:1 + dx + height, 1 + dy:1 + dy + width]
+    return field
+
+def a_star_search(grid, start, state: State, deadline=None):
+    # Anytime: when ``deadline`` (a ``time.perf_counter`` value) passes, the
+    # best path found so far is returned. The f scores are left in
+    # ``state.search_buffers.f``, NaN where the search did not get.
     # Initialize structures
-    pq = []
-    heapq.heappush(pq, (0, start))
-    came_from = {}
-    g_score = {start: 0}
-    max_f_score_node = (0, start)  # To track the node with maximum f_score
-    heur_map = {}
-    f_map = {}
+    buffers = get_search_buffers(state, grid.shape)
+    buffers.reset()
+    width = grid.shape[1]
+    passable = (grid != WALL).ravel().tolist()
+    is_goal = (grid == GOAL).ravel().tolist()
+    # ``grid`` is a window around the bot, standing on ``start`` in its middle
+    visited = state.visited_window(grid.shape[0] // 2)
+    heur_field = heuristic_field(grid, visited).ravel().tolist()
+    # the f score of a visited cell drops by 20 for every step to it
+    visit_penalty = np.where(visited, 20, 0).ravel().tolist()
+    neighbours = buffers.neighbours
+    g_score = buffers._g
+    came_from = buffers._parent
+    closed = buffers._closed
+    heur_map = buffers._heur
+    f_map = buffers._f
+    start_cell = start[0] * width + start[1]
+    g_score[start_cell] = 0
+    pq = [(0, start_cell)]
+    max_f_score_node = (0, start_cell)  # To track the node with maximum f_score
+    expansions = 0
+    frontier_peak = 1
+    timed_out = False
     
     while pq:
-        current_f, (cx, cy) = heapq.heappop(pq)
+        if deadline is not None and time.perf_counter() >= deadline:
+            timed_out = True
+            break
+        current_f, current = heapq.heappop(pq)
+        expansions += 1
         
         # Check if we have reached the goal
-        if grid[cx, cy] == GOAL:
-            path = []
-            while (cx, cy) in came_from:
-                path.append((cx, cy))
-                cx, cy = came_from[(cx, cy)]
-            path.reverse()
-            return path
+        if is_goal[current]:
+            state.telemetry.note(expansions=expansions,
+                                 frontier_peak=frontier_peak,
+                                 search_timed_out=False)
+            return buffers.path_to(current)
 
         if max_f_score_node[0] == 0:
-            max_f_score_node = (current_f, (cx, cy))
+            max_f_score_node = (current_f, current)
         if current_f > max_f_score_node[0]:
-            max_f_score_node = (current_f, (cx, cy))
+            max_f_score_node = (current_f, current)
+        
+        # A cell popped again with the g score it was already expanded with
+        # cannot improve any of its neighbours
+        current_g = g_score[current]
+        if closed[current] == current_g:
+            continue
+        closed[current] = current_g
         
         # Explore neighbors
-        for dx, dy in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
-            nx, ny = cx + dx, cy + dy
-            if is_valid_position(nx, ny, grid):
-                tentative_g_score = g_score[(cx, cy)] + 1
-                if (nx, ny) not in g_score or tentative_g_score < g_score[(nx, ny)]:
-                    came_from[(nx, ny)] = (cx, cy)
-                    g_score[(nx, ny)] = tentative_g_score
-                    heur = heuristic(nx, ny, grid, state, start)
-                    heur_map[(nx, ny)] = heur
-                    f_score = tentative_g_score + heur
-                    f_map[(nx, ny)] = f_score;
-                    gx, gy = state.to_global(nx - start[0], ny - start[1])
-                    if state.is_visited(gx, gy):
-                        f_score -= 20 * tentative_g_score
-                    heapq.heappush(pq, (f_score, (nx, ny)))
-
-    print(f'heuristics neighbour map: {heur_map}')
-    print(f'f_score neighbour map: {f_map}')
+        tentative_g_score = current_g + 1
+        for neighbour in neighbours[current]:
+            if not passable[neighbour]:
+                continue
+            neighbour_g = g_score[neighbour]
+            if neighbour_g < 0 or tentative_g_score < neighbour_g:
+                came_from[neighbour] = current
+                g_score[neighbour] = tentative_g_score
+                heur = heur_field[neighbour]
+                heur_map[neighbour] = heur
+                f_score = tentative_g_score + heur
+                f_map[neighbour] = f_score
+                f_score -= visit_penalty[neighbour] * tentative_g_score
+                heapq.heappush(pq, (f_score, neighbour))
+        if len(pq) > frontier_peak:
+            frontier_peak = len(pq)
+
+    state.telemetry.note(expansions=expansions, frontier_peak=frontier_peak,
+                         search_timed_out=timed_out)
     if max_f_score_node[0] != 0:
-        path = []
-        cx, cy = max_f_score_node[1]
-        while (cx, cy) in came_from:
-            path.append((cx, cy))
-            cx, cy = came_from[(cx, cy)]
-        path.reverse()
-        #path.append(start)
-        #path.append((cx, cy))
-        print(f'the maximum f_score node: {cx}, {cy} : {max_f_score_node[0]}')
-        return path, f_map
+        return buffers.path_to(max_f_score_node[1])
     else:
-        return None  # No path found with a good f_score
+        return []  # No path found with a good f_score
 
 def determine_acceleration_a_star(path, vx, vy):
     if len(path) < 2:
@@ -147,10 +248,6 @@ def determine_acceleration_a_star(path, vx, vy):
     
     next_x, next_y = path[1]
     current_x, current_y = path[0]
-
-    print(f'next_x {next_x}, next_y {next_y}')
-    print(f'current_x {current_x}, current_y {current_y}')
-    print(f'path {path}')
     
     ax = next_x - current_x - vx
     ay = next_y - current_y - vy
@@ -160,15 +257,121 @@ def determine_acceleration_a_star(path, vx, vy):
     
     return ax, ay
 
-def choose_action(x, y, vx, vy, grid, state: State):
-    path, f_map = a_star_search(grid, (x, y), state)
+def local_players(x, y, state: State):
+    # window positions of the other players, the agent stands on (x, y)
+    ox, oy = state.to_global(-x, -y)
+    return [(px - ox, py - oy) for px, py in state.sensor.vision.players
+            if (px - ox, py - oy) != (x, y)]
+
+def choose_waypoint(x, y, path, grid, state: State):
+    # Stick to the waypoint chosen earlier until it is reached, otherwise the
+    # end of the path may jump between far away cells from turn to turn
+    if state.waypoint is not None:
+        ox, oy = state.to_global(-x, -y)
+        wx, wy = state.waypoint[0] - ox, state.waypoint[1] - oy
+        if ((wx, wy) != (x, y) and 0 <= wx < grid.shape[0]
+                and 0 <= wy < grid.shape[1] and grid[wx, wy] != WALL
+                and grid[wx, wy] != NOT_VISIBLE):
+            return wx, wy
+    # the path may go on into cells not seen, the velocity planner can only
+    # use the part before those
+    waypoint = (x, y)
+    for cell in path:
+        if grid[cell] == NOT_VISIBLE:
+            break
+        waypoint = cell
+    state.waypoint = state.to_global(waypoint[0] - x, waypoint[1] - y)
+    return waypoint
+
+def follow_plan(plan, x, y, vx, vy, state: State, to_goal):
+    # remember the rest of a complete plan, in case the next search fails
+    ax, ay = plan.accelerations[0]
+    state.velocity_plan = plan.accelerations[1:]
+    state.velocity_plan_to_goal = to_goal
+    state.velocity_plan_start = (*state.to_global(vx + ax, vy + ay),
+                                 vx + ax, vy + ay)
+    return ax, ay
+
+def planned_acceleration(x, y, vx, vy, blocked, state: State):
+    # The rest of the last complete plan still ends on the goal or somewhere
+    # safe, the cells it crosses have been seen already. It only applies if
+    # the last move went as planned.
+    if (not state.velocity_plan or state.velocity_plan_start !=
+            (*state.to_global(0, 0), vx, vy)):
+        return None
+    ax, ay = state.velocity_plan[0]
+    if (x + vx + ax, y + vy + ay) in blocked:
+        return None
+    state.velocity_plan = state.velocity_plan[1:]
+    state.velocity_plan_start = (*state.to_global(vx + ax, vy + ay),
+                                 vx + ax, vy + ay)
+    return ax, ay
+
+def choose_action(x, y, vx, vy, grid, state: State, deadline=None,
+                  planner='a_star'):
+    # ``planner`` picks the cell path: 'a_star' searches from scratch with
+    # ``a_star_search``, 'incremental' repairs the path of the last turn.
+    # Without a ``deadline``, the turn gets ``state.turn_budget`` from now.
+    turn_start = time.perf_counter()
+    if deadline is None:
+        deadline = turn_deadline(state, turn_start)
+    acceleration, fallback = _choose_action(x, y, vx, vy, grid, state,
+                                            deadline, planner)
+    state.telemetry.note(acceleration=acceleration, fallback=fallback,
+                         turn_time=time.perf_counter() - turn_start)
+    return acceleration
+
+def _choose_action(x, y, vx, vy, grid, state: State, deadline, planner):
+    # the acceleration, and which of the plans below it comes from
+    # the cell path picks where to go, half of the time is left for working
+    # out how to get there
+    now = time.perf_counter()
+    if planner == 'incremental':
+        path = incremental_search.cell_path(x, y, grid, state,
+                                            now + (deadline - now) / 2)
+    else:
+        path = a_star_search(grid, (x, y), state,
+                             now + (deadline - now) / 2)
+        if path:
+            state.f_maps.append(state.search_buffers.f.reshape(grid.shape))
+    state.telemetry.note(search_time=time.perf_counter() - now,
+                         path_length=len(path))
+    blocked = local_players(x, y, state)
+    goals = grid == GOAL
+    nowhere = np.zeros(grid.shape, dtype=bool)
+    if goals.any():
+        now = time.perf_counter()
+        plan = velocity_search.plan(grid, (x, y), (vx, vy), goals, nowhere,
+                                    blocked, now + (deadline - now) / 2)
+        state.telemetry.note(goal_plan_expansions=plan.expansions)
+        if plan.complete:
+            return (follow_plan(plan, x, y, vx, vy, state, to_goal=True),
+                    'goal_plan')
+    # The goal may have left the window since the last plan to it was made,
+    # that plan is still good
+    if state.velocity_plan_to_goal:
+        acceleration = planned_acceleration(x, y, vx, vy, blocked, state)
+        if acceleration is not None:
+            return acceleration, 'stored_goal_plan'
+    # the goal is not known, or only reachable through cells not seen yet
+    waypoints = np.zeros(grid.shape, dtype=bool)
+    waypoints[choose_waypoint(x, y, path, grid, state)] = True
+    plan = velocity_search.plan(grid, (x, y), (vx, vy), nowhere, waypoints,
+                                blocked, deadline)
+    state.telemetry.note(waypoint_plan_expansions=plan.expansions)
+    if plan.complete:
+        return (follow_plan(plan, x, y, vx, vy, state, to_goal=False),
+                'waypoint_plan')
+    acceleration = planned_acceleration(x, y, vx, vy, blocked, state)
+    if acceleration is not None:
+        return acceleration, 'stored_plan'
+    state.velocity_plan = []
+    if plan.accelerations:
+        return plan.accelerations[0], 'partial_plan'
     if path:
         #target_x, target_y = target
         #ax, ay = determine_acceleration(target_x, target_y, x, y, vx, vy, state)
         ax, ay = determine_acceleration_a_star(path, vx, vy)
-        state.f_maps.append(f_map)
-        return ax,ay
+        return (ax, ay), 'cell_path'
     else:
-        return 0, 0
-
-
+        return (0, 0), 'none'
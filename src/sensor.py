@@ -1,44 +1,52 @@
+import numpy as np
+
 class Environment:
     def __init__(self, input: list[str]):
         self.height = int(input[0])
         self.width = int(input[1])
         self.num_of_players = int(input[2])
         self.vis_radius = int(input[3])
+        # the judge only lists the players within the visibility radius,
+        # preceded by their number
+        self.filtered_players = len(input) > 4 and input[4] == '1'
 
 class Physics:
-    def __init__(self, input: list[str]):
+    def __init__(self, input: list):
         self.x = int(input[0])
         self.y = int(input[1])
         self.vx = int(input[2])
         self.vy = int(input[3])
 
 class Vision:
-    def __init__(self, players: list[str], grid: list[str]):
-        self.players = []
-        self.grid = []
-        for line in players:
-            components = line.split()
-            number_list = [int(x) for x in components]
-            self.players.append(number_list)
-        for line in grid:
-            components = line.split()
-            number_list = [int(x) for x in components]
-            self.grid.append(number_list)
-        
+    def __init__(self, players: list[list[int]], grid: np.ndarray):
+        self.players = players
+        # (2 * vis_radius + 1) square around the agent, reused between turns:
+        # copy it to keep it past the next ``Sense``
+        self.grid = grid
+
 class Sensor:
     def __init__(self, input: str):
         temp = input.split()
         self.environment = Environment(temp)
-        
+        side = 2 * self.environment.vis_radius + 1
+        self.grid = np.empty((side, side), dtype=np.int8)
+
     def Sense(self, input: str):
         if input == "~~~END~~~\n":
             return False
-        lines = input.splitlines()
-        self.physics = Physics(lines[0].split())
-        lines = lines[1:]
-        players = lines[:self.environment.num_of_players]
-        lines = lines[self.environment.num_of_players:]
-        grid = lines[:2 * self.environment.vis_radius + 1]
-        self.vision = Vision(players, grid)
+        # every line is whitespace separated integers, parse them all at once
+        values = np.fromstring(input, dtype=np.int32, sep=' ')
+        self.physics = Physics(values[:4].tolist())
+        if self.environment.filtered_players:
+            num_of_players = int(values[4])
+            offset = 5
+        else:
+            num_of_players = self.environment.num_of_players
+            offset = 4
+        end = offset + 2 * num_of_players
+        self.vision = Vision(values[offset:end].reshape(-1, 2).tolist(),
+                             self.grid)
+        np.copyto(self.grid,
+                  values[end:end + self.grid.size].reshape(self.grid.shape),
+                  casting='unsafe')
         return True
-        
@@ -1,4 +1,7 @@
 from sensor import *
+from telemetry import Telemetry
+from f_score_history import FScoreHistory
+import numpy as np
 
 # Constants
 EMPTY = 0
@@ -7,15 +10,80 @@ START = 1
 NOT_VISIBLE = 3
 GOAL = 100
 
+# The judge's default ``--timeout``, the bot is not told the actual one
+STEP_TIMEOUT = 1.0
+# Time kept for sending the answer and for the judge's own overhead
+SAFETY_MARGIN = 0.3
+
 class State:
-    def __init__(self, sensor: Sensor):
-        self.player_global_visited = set()
+    def __init__(self, sensor: Sensor, plan_radius=None, telemetry=None,
+                 f_maps=None, turn_budget=None):
         self.sensor = sensor
+        # seconds the bot may think per turn, from receiving the observation
+        if turn_budget is None:
+            turn_budget = STEP_TIMEOUT - SAFETY_MARGIN
+        self.turn_budget = turn_budget
+        environment = sensor.environment
+        # the planner works on the remembered map this far around the bot
+        if plan_radius is None:
+            plan_radius = 2 * environment.vis_radius
+        self.plan_radius = max(plan_radius, environment.vis_radius)
+        # Everything seen so far, cells never seen are NOT_VISIBLE. The map is
+        # padded with walls, so windows around the bot are always slices.
+        self.map_padding = self.plan_radius
+        self.global_map = np.full(
+            (environment.height + 2 * self.map_padding,
+             environment.width + 2 * self.map_padding), WALL, dtype=np.int8)
+        self.global_map[self.map_padding:-self.map_padding,
+                        self.map_padding:-self.map_padding] = NOT_VISIBLE
+        # cells the bot has stood on, padded the same way as the map
+        self.visited = np.zeros(self.global_map.shape, dtype=bool)
         self.player_last_acc = (0,0)
-        self.f_maps = list()
+        # f-score fields of the cell searches that found a path
+        if f_maps is None:
+            f_maps = FScoreHistory()
+        self.f_maps = f_maps
+        # global position the bot is heading to while exploring
+        self.waypoint = None
+        # rest of the last complete plan of ``velocity_search.plan``, the
+        # (x, y, vx, vy) it continues from and whether it ends on the goal
+        self.velocity_plan = []
+        self.velocity_plan_start = None
+        self.velocity_plan_to_goal = False
+        # ``incremental_search.DStarLite`` kept between turns
+        self.incremental_planner = None
+        # reused by ``search.a_star_search``
+        self.search_buffers = None
+        # what the planner did each turn, disabled unless one is given
+        if telemetry is None:
+            telemetry = Telemetry()
+        self.telemetry = telemetry
+    def _in_map(self, x, y):
+        return (0 <= x + self.map_padding < self.visited.shape[0]
+                and 0 <= y + self.map_padding < self.visited.shape[1])
     def add_global(self, x, y):
-        self.player_global_visited.add((x,y))
+        if self._in_map(x, y):
+            self.visited[x + self.map_padding, y + self.map_padding] = True
     def is_visited(self, x, y):
-        return (x,y) in self.player_global_visited
+        return (self._in_map(x, y)
+                and bool(self.visited[x + self.map_padding, y + self.map_padding]))
+    def visited_cells(self):
+        return [(x - self.map_padding, y - self.map_padding)
+                for x, y in np.argwhere(self.visited).tolist()]
+    def _window(self, array, radius):
+        x = self.sensor.physics.x + self.map_padding
+        y = self.sensor.physics.y + self.map_padding
+        return array[x - radius:x + radius + 1, y - radius:y + radius + 1]
+    def map_window(self, radius):
+        # view of the remembered map around the bot, it stands in the middle
+        return self._window(self.global_map, radius)
+    def visited_window(self, radius):
+        # visited mask of the same cells as ``map_window``
+        return self._window(self.visited, radius)
+    def update_map(self, grid):
+        # write the cells in sight from the current observation
+        grid = np.asarray(grid)
+        window = self.map_window(grid.shape[0] // 2)
+        np.copyto(window, grid, where=grid != NOT_VISIBLE)
     def to_global(self, local_dx, local_dy):
         return (self.sensor.physics.x + local_dx, self.sensor.physics.y + local_dy)
\ No newline at end of file
@@ -0,0 +1,45 @@
+import json
+import signal
+from collections import deque
+
+class Telemetry:
+    """
+    What the planner did in the last ``capacity`` turns, one dict per turn.
+
+    The planner reports with ``note`` during the turn, and ``end_turn`` files
+    the record. A disabled ``Telemetry`` drops everything on the first check,
+    so the calls can stay in the planner.
+    """
+
+    def __init__(self, capacity=1000, enabled=False):
+        self.enabled = enabled
+        self.records = deque(maxlen=capacity)
+        self.turn = 0
+        self.current = {}
+
+    def note(self, **fields):
+        if not self.enabled:
+            return
+        self.current.update(fields)
+
+    def end_turn(self):
+        if not self.enabled:
+            return
+        self.current['turn'] = self.turn
+        self.records.append(self.current)
+        self.turn += 1
+        self.current = {}
+
+    def dump(self, fname: str):
+        # one JSON object per line, oldest turn first
+        with open(fname, 'w') as f:
+            for record in self.records:
+                f.write(json.dumps(record) + '\n')
+
+    def dump_on_signal(self, fname: str, signum=None):
+        # SIGUSR1 by default, where there is one
+        if signum is None:
+            signum = getattr(signal, 'SIGUSR1', None)
+            if signum is None:
+                return
+        signal.signal(signum, lambda *_: self.dump(fname))
@@ -0,0 +1,136 @@
+import heapq
+import time
+import numpy as np
+from functools import lru_cache
+from typing import NamedTuple
+from judge.grid_race_env import valid_line
+from state import *
+
+# The nine accelerations a player can choose from
+ACCELERATIONS = [(ax, ay) for ax in (-1, 0, 1) for ay in (-1, 0, 1)]
+# Largest speed (per axis) a waypoint may be reached with. From there the bot
+# can stop in one turn, whatever the next observation reveals.
+SAFE_SPEED = 1
+
+class Plan(NamedTuple):
+    accelerations: list[tuple[int, int]]
+    expansions: int
+    # whether the plan reaches a target, rather than just getting closer
+    complete: bool
+
+@lru_cache(maxsize=None)
+def turns_to_cover(speed, distance):
+    """
+    Fewest turns needed to move ``distance`` cells (Chebyshev distance) when
+    starting with ``speed``: every turn the speed grows by at most one.
+    """
+    turns = 0
+    covered = 0
+    while covered < distance:
+        turns += 1
+        covered += speed + turns
+    return turns
+
+def chebyshev_distance_field(targets):
+    """
+    Chebyshev distance of every cell from the nearest target, ignoring walls,
+    so it never overestimates the distance a move has to cover.
+    """
+    height, width = targets.shape
+    unreachable = height * width
+    field = np.where(targets, 0, unreachable)
+    while True:
+        padded = np.pad(field, 1, constant_values=unreachable)
+        nearest = field
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                nearest = np.minimum(
+                    nearest,
+                    padded[1 + dx:1 + dx + height, 1 + dy:1 + dy + width] + 1)
+        if np.array_equal(nearest, field):
+            return field
+        field = nearest
+
+def plan(track, pos, vel, goals, waypoints, blocked=(), deadline=None):
+    """
+    A* over (x, y, vx, vy) states: one step is one turn with one of the nine
+    accelerations, moves are checked with the judge's ``valid_line``.
+
+    A plan ends on a ``goals`` cell with any velocity, or on a ``waypoints``
+    cell with at most ``SAFE_SPEED``. Cells not seen are treated as walls, and
+    the ``blocked`` cells (other players) cannot be moved to in the first turn.
+
+    When ``deadline`` passes, the plan leads to the expanded state closest to
+    the targets instead, preferring states slow enough to stop. The list of
+    accelerations is empty if no move is possible.
+    """
+    targets = goals | waypoints
+    if not targets.any():
+        return Plan([], 0, False)
+    passable = (track >= 0) & (track != NOT_VISIBLE)
+    distance = chebyshev_distance_field(targets).tolist()
+    is_goal = goals.tolist()
+    is_waypoint = waypoints.tolist()
+    height, width = track.shape
+    blocked = set(blocked)
+    lines = {}  # valid_line results, many states share the same move
+
+    def heuristic(x, y, vx, vy):
+        return turns_to_cover(max(abs(vx), abs(vy)), distance[x][y])
+
+    start = (pos[0], pos[1], vel[0], vel[1])
+    g_score = {start: 0}  # transposition table
+    came_from = {}
+    pq = [(heuristic(*start), heuristic(*start), 0, start)]
+    # (fast, h, g, state) of the expanded state closest to the targets
+    best = None
+    expansions = 0
+
+    while pq:
+        if deadline is not None and time.perf_counter() >= deadline:
+            break
+        _, h, g, current = heapq.heappop(pq)
+        if g > g_score[current]:
+            continue  # reached on a shorter way since
+        expansions += 1
+        x, y, vx, vy = current
+        if g > 0:
+            fast = abs(vx) > SAFE_SPEED or abs(vy) > SAFE_SPEED
+            if is_goal[x][y] or (is_waypoint[x][y] and not fast):
+                return Plan(_accelerations(came_from, current), expansions,
+                            True)
+            if best is None or (fast, h, g) < best[:3]:
+                best = (fast, h, g, current)
+        tentative_g_score = g + 1
+        for ax, ay in ACCELERATIONS:
+            nvx, nvy = vx + ax, vy + ay
+            nx, ny = x + nvx, y + nvy
+            if not (0 <= nx < height and 0 <= ny < width
+                    and passable[nx, ny]):
+                continue
+            if g == 0 and (nx, ny) in blocked:
+                continue
+            line = (x, y, nx, ny)
+            if line not in lines:
+                lines[line] = valid_line(passable, (x, y), (nx, ny))
+            if not lines[line]:
+                continue
+            neighbour = (nx, ny, nvx, nvy)
+            if tentative_g_score < g_score.get(neighbour, tentative_g_score + 1):
+                g_score[neighbour] = tentative_g_score
+                came_from[neighbour] = (current, (ax, ay))
+                heur = heuristic(nx, ny, nvx, nvy)
+                heapq.heappush(pq, (tentative_g_score + heur, heur,
+                                    tentative_g_score, neighbour))
+
+    if best is None:
+        return Plan([], expansions, False)
+    return Plan(_accelerations(came_from, best[3]), expansions, False)
+
+def _accelerations(came_from, state):
+    accelerations = []
+    while state in came_from:
+        state, acc = came_from[state]
+        accelerations.append(acc)
+    accelerations.reverse()
+    return accelerations
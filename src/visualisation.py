@@ -1,9 +1,135 @@
 import argparse
+import collections
+import multiprocessing
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import numpy as np
 import pygame
 from judge import replay
 
 from typing import Optional
 
+class TrackTiles:
+    """
+    The track image cut into square tiles, rendered from the track array with
+    numpy when first shown and kept for a while. A cell size (zoom level)
+    gives its own set of tiles, so only what is on the screen gets rendered.
+    """
+    TILE_SIZE = 256
+    # number of tiles kept, enough for a full window at any zoom level
+    CACHE_SIZE = 96
+    WALL_COLOUR = 'red'
+    FREE_COLOUR = 'lightgreen'
+    LINE_COLOUR = 'gray'
+    WALL_LINE_COLOUR = 'darkred'
+
+    def __init__(self, track: list[list[int]]):
+        track = np.array(track)
+        walls = track < 0
+        # the squares between four walls are red
+        self.wall_squares = (walls[:-1, :-1] & walls[1:, :-1]
+                             & walls[:-1, 1:] & walls[1:, 1:])
+        # thick lines between neighbouring walls, horizontal and vertical
+        self.wall_rows = walls[:, :-1] & walls[:, 1:]
+        self.wall_columns = walls[:-1, :] & walls[1:, :]
+        self.goal = track == 100
+        self.shape = track.shape
+        self._cache = collections.OrderedDict()
+
+    @staticmethod
+    def _rgb(colour: str) -> np.ndarray:
+        return np.array(pygame.Color(colour)[:3], dtype=np.uint8)
+
+    def size(self, cell_size: int) -> tuple[int, int]:
+        # the image reaches from the first grid point to the last one
+        rows, columns = self.shape
+        return ((columns - 1) * cell_size + 1, (rows - 1) * cell_size + 1)
+
+    def tiles(self, cell_size: int, view: pygame.Rect):
+        # (tile, position in the image) of the tiles overlapping ``view``
+        width, height = self.size(cell_size)
+        view = view.clip(pygame.Rect(0, 0, width, height))
+        t = self.TILE_SIZE
+        for ty in range(view.top // t, (view.bottom - 1) // t + 1):
+            for tx in range(view.left // t, (view.right - 1) // t + 1):
+                yield self.tile(cell_size, ty, tx), (tx * t, ty * t)
+
+    def tile(self, cell_size: int, ty: int, tx: int) -> pygame.Surface:
+        key = (cell_size, ty, tx)
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        surface = self._render(cell_size, ty, tx)
+        self._cache[key] = surface
+        if len(self._cache) > self.CACHE_SIZE:
+            self._cache.popitem(last=False)
+        return surface
+
+    def _render(self, cell_size: int, ty: int, tx: int) -> pygame.Surface:
+        s = cell_size
+        rows, columns = self.shape
+        width, height = self.size(s)
+        t = self.TILE_SIZE
+        # pixel coordinates of the tile in the whole image
+        py = np.arange(ty * t, min((ty + 1) * t, height))[:, np.newaxis]
+        px = np.arange(tx * t, min((tx + 1) * t, width))[np.newaxis, :]
+        shape = np.broadcast_shapes(py.shape, px.shape)
+
+        # Looks as if drawn grid point by grid point, rows from the top: the
+        # square right below and right of the point, then the lines leading
+        # up and left to it. Where these overlap, the last one drawn shows,
+        # so every pixel gets the colour of its last covering shape.
+        palette = np.array([
+            self._rgb(colour) for colour in (self.FREE_COLOUR,
+                                             self.WALL_COLOUR, self.LINE_COLOUR,
+                                             self.WALL_LINE_COLOUR, 'black')
+        ])
+        last = np.full(shape, -1)
+        colour = np.full(shape, 4)
+
+        def paint(order, covers, index):
+            covers = covers & (order > last)
+            last[covers] = np.broadcast_to(order, shape)[covers]
+            colour[covers] = np.broadcast_to(index, shape)[covers]
+
+        i, j = py // s, px // s
+        ic, jc = np.minimum(i, rows - 2), np.minimum(j, columns - 2)
+        paint(3 * (ic * columns + jc), (i <= rows - 2) & (j <= columns - 2),
+              self.wall_squares[ic, jc].astype(int))
+        # the lines ending on the grid points around the pixel, 3 pixels wide
+        # between walls, the ones of the first row and column lead outside
+        for a in (i, i + 1):
+            for b in (j, j + 1):
+                ac, bc = np.minimum(a, rows - 1), np.minimum(b, columns - 1)
+                point = ac * columns + bc
+                wall = (ac > 0) & self.wall_columns[np.maximum(ac - 1, 0),
+                                                    bc]
+                covers = ((a < rows) & (b < columns) & ((a - 1) * s <= py)
+                          & (py <= a * s) & (np.abs(px - b * s) <= wall))
+                paint(3 * point + 1, covers, np.where(wall, 3, 2))
+                wall = (bc > 0) & self.wall_rows[ac, np.maximum(bc - 1, 0)]
+                covers = ((a < rows) & (b < columns) & ((b - 1) * s <= px)
+                          & (px <= b * s) & (np.abs(py - a * s) <= wall))
+                paint(3 * point + 2, covers, np.where(wall, 3, 2))
+        rgb = palette[colour]
+
+        # goal cells are checkered squares centred on their grid points
+        goal_i = np.minimum((py + (s + 1) // 2) // s, rows - 1)
+        goal_j = np.minimum((px + (s + 1) // 2) // s, columns - 1)
+        goal = self.goal[goal_i, goal_j]
+        black = (goal_i + goal_j) % 2 == 0
+        rgb[goal & black] = self._rgb('black')
+        rgb[goal & ~black] = self._rgb('white')
+
+        # surfarray indexes (x, y)
+        surface = pygame.surfarray.make_surface(rgb.transpose(1, 0, 2))
+        if pygame.display.get_surface() is not None:
+            surface = surface.convert()
+        return surface
+
 class Screen:
     MARGIN = 10
     DEFAULT_TRACK_CELL_SIZE = 12
@@ -15,6 +141,15 @@ class Screen:
         100: 'blue',
     }
     FOG_COLOUR = (50, 50, 50, 180)
+    # number of fog surfaces kept, one per position and view
+    FOG_CACHE_SIZE = 4
+    # the window is not made larger than this, for larger tracks it shows a
+    # part of the track, which can be moved and zoomed
+    MAX_WINDOW_SIZE = (1600, 1000)
+    MIN_CELL_SIZE = 1
+    MAX_CELL_SIZE = 64
+    # pixels moved by a key press
+    PAN_STEP = 100
     TRACK_GRID_COLOUR = (50, 50, 50, 100)
     # stolen from Matplotlib's tab10
     PLAYER_COLOURS = [[31, 119, 180], [255, 127, 14], [44, 160, 44],
@@ -34,121 +169,167 @@ class Screen:
                  env_info: replay.EnvInfo,
                  cell_size: int,
                  visibility_radius: Optional[int],
-                 should_draw_fog: bool = True):
-        track_width = len(env_info.track[0])
-        track_height = len(env_info.track)
+                 should_draw_fog: bool = True,
+                 max_window_size: Optional[tuple[int, int]] = None):
+        if max_window_size is None:
+            max_window_size = self.MAX_WINDOW_SIZE
+        width, height = self.window_size(env_info, cell_size)
         self.track_cell_size = cell_size
-        self.trace_width = self.track_cell_size // 8 + 1
         self.grid_line_width = self.DEFAULT_GRID_LINE_WIDTH
-        width = track_width * self.track_cell_size + 2 * self.MARGIN
-        height = (
-            4 * self.MARGIN  #
-            + track_height * self.track_cell_size  # track
-            + 2 * self.FONT_SIZE  # status lines
-        )
+        # the window shows the whole track if it fits, a part of it otherwise
+        width = min(width, max_window_size[0])
+        height = min(height, max_window_size[1])
         self.screen = pygame.display.set_mode((width, height),
                                               flags=pygame.RESIZABLE)
         self.font = pygame.font.SysFont('', self.FONT_SIZE)
-        self.track_height = track_height * self.track_cell_size
-        self._draw_track_first(env_info)
+        self.tiles = TrackTiles(env_info.track)
+        # the top left corner of the view, in pixels of the track image
+        self.view_x = self.view_y = 0
         self.should_draw_fog = should_draw_fog
         self.visibility_radius = visibility_radius
         self.env_info = env_info
+        self._fog_cache = collections.OrderedDict()
+        self._fog_stencil = None
+        # the arrows are drawn onto this, kept while the window size is
+        self._overlay = None
+        # what the last frame was drawn for, and where its players and
+        # arrows are
+        self._layout = None
+        self._dynamic = None
+
+    @classmethod
+    def window_size(cls, env_info: replay.EnvInfo,
+                    cell_size: int) -> tuple[int, int]:
+        # to show the whole track
+        width = len(env_info.track[0]) * cell_size + 2 * cls.MARGIN
+        height = (
+            4 * cls.MARGIN  #
+            + len(env_info.track) * cell_size  # track
+            + 2 * cls.FONT_SIZE  # status lines
+        )
+        return width, height
+
+    @classmethod
+    def fitting_cell_size(cls, env_info: replay.EnvInfo, cell_size: int,
+                          max_window_size: tuple[int, int]) -> int:
+        # the largest up to ``cell_size`` that shows the whole track
+        width, height = cls.window_size(env_info, 0)
+        return max(
+            1,
+            min(cell_size,
+                (max_window_size[0] - width) // len(env_info.track[0]),
+                (max_window_size[1] - height) // len(env_info.track)))
+
+    @property
+    def trace_width(self) -> int:
+        return self.track_cell_size // 8 + 1
+
+    @property
+    def track_height(self) -> int:
+        # of the part of the window the track is shown in
+        return max(self.screen.get_height() - 4 * self.MARGIN
+                   - 2 * self.FONT_SIZE, 0)
+
+    def track_area(self) -> pygame.Rect:
+        width = max(self.screen.get_width() - 2 * self.MARGIN, 0)
+        return pygame.Rect(self.MARGIN, self.MARGIN, width, self.track_height)
 
     def _cell_pos(self, r: int, c: int) -> tuple[int, int]:
-        y = self.MARGIN + self.track_cell_size * r
-        x = self.MARGIN + self.track_cell_size * c
+        y = self.MARGIN + self.track_cell_size * r - self.view_y
+        x = self.MARGIN + self.track_cell_size * c - self.view_x
         return y, x
 
+    def _clamp_view(self) -> None:
+        area = self.track_area()
+        width, height = self.tiles.size(self.track_cell_size)
+        self.view_x = max(0, min(self.view_x, width - area.width))
+        self.view_y = max(0, min(self.view_y, height - area.height))
+
+    def pan(self, dx: int, dy: int) -> None:
+        self.view_x += dx
+        self.view_y += dy
+        self._clamp_view()
+
+    def zoom(self, steps: int, pos: Optional[tuple[int, int]] = None) -> None:
+        # the point of the track under ``pos`` (window centre by default)
+        # stays in place
+        if pos is None:
+            pos = self.track_area().center
+        old = self.track_cell_size
+        new = old
+        for _ in range(abs(steps)):
+            if steps > 0:
+                new = max(new + 1, round(new * 1.25))
+            else:
+                new = min(new - 1, round(new / 1.25))
+        new = max(self.MIN_CELL_SIZE, min(new, self.MAX_CELL_SIZE))
+        if new == old:
+            return
+        x = (pos[0] - self.MARGIN + self.view_x) / old
+        y = (pos[1] - self.MARGIN + self.view_y) / old
+        self.track_cell_size = new
+        self.view_x = round(x * new) - pos[0] + self.MARGIN
+        self.view_y = round(y * new) - pos[1] + self.MARGIN
+        self._clamp_view()
+
     def draw_track(self) -> None:
-        self.screen.blit(self.track_surface, (self.MARGIN, self.MARGIN))
-
-    def _draw_track_first(self, env_info: replay.EnvInfo) -> None:
-        width = (len(env_info.track[0])
-                 - 1) * self.track_cell_size + self.grid_line_width
-        height = (len(env_info.track)
-                  - 1) * self.track_cell_size + self.grid_line_width
-        self.track_surface = pygame.Surface((width, height))
-        grid_surface = pygame.Surface((width, height)).convert_alpha()
-        grid_surface.fill((0, 0, 0, 0))
-
-        c = env_info.track
-        for i, row in enumerate(env_info.track):  # row_ind
-            for j, cell in enumerate(row):  # col_ind
-                # draw a rectangle if not in the last row or column
-                if i + 1 < len(env_info.track) and j + 1 < len(
-                        env_info.track[0]):
-                    cell_color = self.TRACK_COLOURS[-1] if c[i][j] < 0 and c[
-                        i + 1][j] < 0 and c[i][j + 1] < 0 and c[i + 1][
-                            j + 1] < 0 else self.TRACK_COLOURS[0]
-                    pygame.draw.rect(
-                        self.track_surface, cell_color,
-                        pygame.Rect(j * self.track_cell_size,
-                                    i * self.track_cell_size,
-                                    self.track_cell_size, self.track_cell_size))
-                # draw separating lines
-                x = j * self.track_cell_size
-                y = i * self.track_cell_size
-                border_color = 'darkred' if i > 0 and c[i][j] < 0 and c[
-                    i - 1][j] < 0 else 'gray'
-                pygame.draw.line(
-                    self.track_surface,
-                    border_color, (x, y), (x, y - self.track_cell_size),
-                    width=(3 if border_color == 'darkred' else 1)
-                    * self.grid_line_width)
-                border_color = 'darkred' if j > 0 and c[i][j] < 0 and c[i][
-                    j - 1] < 0 else 'gray'
-                pygame.draw.line(
-                    self.track_surface,
-                    border_color, (x, y), (x - self.track_cell_size, y),
-                    width=(3 if border_color == 'darkred' else 1)
-                    * self.grid_line_width)
-                # draw goal field
-                if c[i][j] == 100:
-                    pygame.draw.rect(
-                        grid_surface, 'black' if (i+j) % 2 == 0 else 'white',
-                        pygame.Rect((j-0.5) * self.track_cell_size,
-                                    (i-0.5) * self.track_cell_size,
-                                    self.track_cell_size, self.track_cell_size))
-
-        self.track_surface.blit(grid_surface, (0, 0))
+        area = self.track_area()
+        view = pygame.Rect(self.view_x, self.view_y, area.width, area.height)
+        for tile, (x, y) in self.tiles.tiles(self.track_cell_size, view):
+            self.screen.blit(tile, (self.MARGIN + x - self.view_x,
+                                    self.MARGIN + y - self.view_y))
 
-    def draw_fog(self, player: replay.PlayerState) -> None:
-        height = len(self.env_info.track)
-        width = len(self.env_info.track[0])
-        surface_width = (len(self.env_info.track[0])
-                         - 1) * self.track_cell_size + self.grid_line_width
-        surface_height = (len(self.env_info.track)
-                          - 1) * self.track_cell_size + self.grid_line_width
-        surface = pygame.Surface(
-            (surface_width, surface_height)).convert_alpha()
+    def _make_fog_stencil(self) -> None:
+        # the disc the players see through, blitted with BLEND_RGBA_MIN:
+        # white keeps the fog, transparent clears it
+        r = self.visibility_radius
+        d = np.arange(-r, r + 1)
+        fogged = d[:, np.newaxis]**2 + d[np.newaxis, :]**2 > r**2
+        fogged = fogged.repeat(self.track_cell_size, axis=0).repeat(
+            self.track_cell_size, axis=1)
+        self._fog_stencil = pygame.Surface(fogged.shape[::-1], pygame.SRCALPHA)
+        self._fog_stencil.fill((255, 255, 255, 255))
+        colours = pygame.surfarray.pixels3d(self._fog_stencil)
+        alpha = pygame.surfarray.pixels_alpha(self._fog_stencil)
+        # surfarray indexes (x, y), the track (row, column)
+        colours[~fogged.T] = 0
+        alpha[~fogged.T] = 0
+        del colours, alpha  # unlocks the surface
+
+    def _fog_surface(self, x: int, y: int) -> pygame.Surface:
+        # as large as the track area, not the track
+        area = self.track_area()
+        size = self.track_cell_size
+        key = (x, y, size, self.view_x, self.view_y, area.size)
+        if key in self._fog_cache:
+            self._fog_cache.move_to_end(key)
+            return self._fog_cache[key]
+        if (self._fog_stencil is None
+                or self._fog_stencil.get_width() !=
+                (2 * self.visibility_radius + 1) * size):
+            self._make_fog_stencil()
+        surface = pygame.Surface(area.size, pygame.SRCALPHA)
         surface.fill((0, 0, 0, 0))
-        for row_ind in range(height):
-            for col_ind in range(width):
-                if ((player.x - row_ind)**2 +
-                    (player.y - col_ind)**2)**0.5 > self.visibility_radius:
-                    if col_ind == width - 1:
-                        rect_width = self.track_cell_size / 2
-                    else:
-                        rect_width = self.track_cell_size
-                    if row_ind == height - 1:
-                        rect_height = self.track_cell_size / 2
-                    else:
-                        rect_height = self.track_cell_size
-                    if col_ind == 0:
-                        left = 0
-                        rect_width = self.track_cell_size / 2
-                    else:
-                        left = (col_ind-0.5) * self.track_cell_size
-                    if row_ind == 0:
-                        top = 0
-                        rect_height = self.track_cell_size / 2
-                    else:
-                        top = (row_ind-0.5) * self.track_cell_size
-                    pygame.draw.rect(
-                        surface, self.FOG_COLOUR,
-                        pygame.Rect(left, top, rect_width, rect_height))
-        self.screen.blit(surface, (self.MARGIN, self.MARGIN))
+        # up to the grid points of the last row and column, a pixel less for
+        # odd cell sizes, where the cells start half a pixel to the left
+        width = (len(self.env_info.track[0]) - 1) * size - size % 2
+        height = (len(self.env_info.track) - 1) * size - size % 2
+        surface.fill(self.FOG_COLOUR,
+                     pygame.Rect(-self.view_x, -self.view_y, width, height))
+        # the cell (x, y) is centred on its grid point
+        offset = self.visibility_radius * size + (size + 1) // 2
+        surface.blit(self._fog_stencil,
+                     (y * size - offset - self.view_x,
+                      x * size - offset - self.view_y),
+                     special_flags=pygame.BLEND_RGBA_MIN)
+        self._fog_cache[key] = surface
+        if len(self._fog_cache) > self.FOG_CACHE_SIZE:
+            self._fog_cache.popitem(last=False)
+        return surface
+
+    def draw_fog(self, player: replay.PlayerState) -> None:
+        self.screen.blit(self._fog_surface(player.x, player.y),
+                         (self.MARGIN, self.MARGIN))
 
     def draw_players(self, state: replay.State):
         for i, p in enumerate(state.players):
@@ -163,11 +344,35 @@ class Screen:
                 self.track_cell_size / 3 + 1,
                 width=1)
 
+    def invalidate(self) -> None:
+        # the next frame is drawn whole
+        self._layout = None
+
+    def _dynamic_rect(
+            self, state: Optional[replay.State],
+            last_state: Optional[replay.State]) -> Optional[pygame.Rect]:
+        # the part of the window the players and the arrows are drawn to
+        cells = []
+        if state is not None:
+            for p in state.players:
+                cells.append((p.x, p.y))
+                cells.append((p.x + p.vel_x - 1, p.y + p.vel_y - 1))
+                cells.append((p.x + p.vel_x + 1, p.y + p.vel_y + 1))
+        if last_state is not None:
+            cells.extend((p.x, p.y) for p in last_state.players)
+        if not cells:
+            return None
+        top, left = self._cell_pos(min(r for r, _ in cells),
+                                   min(c for _, c in cells))
+        bottom, right = self._cell_pos(max(r for r, _ in cells),
+                                       max(c for _, c in cells))
+        pad = self.track_cell_size + self.trace_width
+        return pygame.Rect(left - pad, top - pad, right - left + 2 * pad,
+                           bottom - top + 2 * pad)
+
     def draw_forward_arrows(self, state: replay.State):
-        buffer = pygame.Surface(
-            (self.track_surface.get_width(),
-             self.track_surface.get_height())).convert_alpha()
-        buffer.fill((0, 0, 0, 0))
+        # onto the overlay, ``draw_all`` puts it on the screen
+        buffer = self._overlay
         for i, p in enumerate(state.players):
             y, x = self._cell_pos(p.x, p.y)
             y2, x2 = self._cell_pos(p.x + p.vel_x, p.y + p.vel_y)
@@ -181,14 +386,11 @@ class Screen:
                     y, x = self._cell_pos(xx, yy)
                     pygame.draw.circle(buffer, self.PLAYER_COLOURS[i] + [160],
                                        (x, y), self.track_cell_size / 4 + 1)
-        self.screen.blit(buffer, (0, 0))
 
     def draw_backward_arrows(self, last_state: replay.State,
                              state: replay.State) -> None:
-        buffer = pygame.Surface(
-            (self.track_surface.get_width(),
-             self.track_surface.get_height())).convert_alpha()
-        buffer.fill((0, 0, 0, 0))
+        # onto the overlay, over the forward arrows
+        buffer = self._overlay
         for i, (p_old,
                 p_now) in enumerate(zip(last_state.players, state.players)):
             if p_old == p_now:
@@ -209,10 +411,15 @@ class Screen:
                 buffer,
                 self.PLAYER_COLOURS[i], (x - r, y + r), (x + r, y - r),
                 width=self.trace_width)
-        self.screen.blit(buffer, (0, 0))
 
-    def print_info(self, t: int | str, last_step: Optional[replay.PlayerStep]):
-        line = self.font.render(f'Turn: {t}', True, self.FONT_COLOUR, 'black')
+    def print_info(self,
+                   t: int | str,
+                   last_step: Optional[replay.PlayerStep],
+                   loading: Optional[float] = None):
+        text = f'Turn: {t}'
+        if loading is not None:
+            text += f'  (loading: {loading:.0%})'
+        line = self.font.render(text, True, self.FONT_COLOUR, 'black')
         y = 2 * self.MARGIN + self.track_height
         self.screen.blit(line, (self.MARGIN, y))
         if last_step is not None:
@@ -234,28 +441,150 @@ class Screen:
                              (self.MARGIN + player_legend.get_width(), y))
 
     def draw_all(self,
-                 state: replay.State,
+                 state: Optional[replay.State],
                  last_state: Optional[replay.State],
                  last_step: Optional[replay.PlayerStep],
                  next_player: Optional[replay.PlayerState],
-                 max_t: Optional[str] = None) -> None:
-        self.screen.fill('black')
+                 max_t: Optional[str] = None,
+                 loading: Optional[float] = None) -> list[pygame.Rect]:
+        """
+        Draws the parts of the window that may have changed since the last
+        call, and returns them (for ``pygame.display.update``). Those are the
+        status lines and where the players and arrows were and are now. If
+        the view, the window or the fog changed, that is all of it.
+        """
+        area = self.track_area()
+        fog_player = next_player if self.should_draw_fog else None
+        layout = (self.screen.get_size(), self.track_cell_size, self.view_x,
+                  self.view_y, self.should_draw_fog,
+                  fog_player and (fog_player.x, fog_player.y))
+        dynamic = self._dynamic_rect(state, last_state)
+        if self._overlay is None or \
+                self._overlay.get_size() != self.screen.get_size():
+            self._overlay = pygame.Surface(
+                self.screen.get_size()).convert_alpha()
+            self._overlay.fill((0, 0, 0, 0))
+        elif self._dynamic is not None:
+            # the arrows of the last frame are all in there
+            self._overlay.fill((0, 0, 0, 0), self._dynamic)
+        if layout != self._layout:
+            dirty = self.screen.get_rect()
+        else:
+            changed = [r for r in (self._dynamic, dynamic) if r is not None]
+            dirty = area.clip(changed[0].unionall(changed[1:])) \
+                    if changed else pygame.Rect(area.topleft, (0, 0))
+        # the track may not reach the end of the window
+        self.screen.fill('black', dirty)
+        self._layout = layout
+        self._dynamic = dynamic
+
+        # nothing of the track is drawn over the margins and the status lines
+        self.screen.set_clip(dirty.clip(area))
         self.draw_track()
-        if self.should_draw_fog and next_player:
+        if fog_player:
             assert self.visibility_radius is not None, 'Need visibility radius'
-            self.draw_fog(next_player)
-        self.draw_players(state)
-        self.draw_forward_arrows(state)
+            self.draw_fog(fog_player)
+        # no state yet while the replay is loading
+        if state is not None:
+            self.draw_players(state)
+            self.draw_forward_arrows(state)
         if last_state is not None:
             self.draw_backward_arrows(last_state, state)
+        self.screen.blit(self._overlay, (0, 0))
+        self.screen.set_clip(None)
+
+        status = pygame.Rect(0, area.bottom, self.screen.get_width(),
+                             self.screen.get_height() - area.bottom)
+        self.screen.fill('black', status)
+        turn = '-' if state is None else str(state.turn)
         if max_t:
-            turn = f'{state.turn} / {max_t}'
-        else:
-            turn = str(state.turn)
-        self.print_info(turn, last_step)
+            turn = f'{turn} / {max_t}'
+        self.print_info(turn, last_step, loading)
+        return [dirty, status]
+
+class ReplayLoader:
+    """
+    Reads a replay in a background thread, into ``history`` that the viewer
+    already shows: its lists only grow. ``start`` returns once the track is
+    there.
+    """
+
+    def __init__(self, fname: str):
+        self.stream = replay.ReplayStream(fname)
+        self.history = None
+        self.turns = None
+        self.done = False
+        self.error = None
+        self._ready = threading.Event()
+        # does not keep the viewer running once its window is closed
+        self._thread = threading.Thread(target=self._load, daemon=True)
 
-def app(history: replay.Replay, cell_size: int,
+    def start(self) -> replay.Replay:
+        self._thread.start()
+        self._ready.wait()
+        if self.history is None:
+            raise ValueError(f'No track in {self.stream.fname}') from self.error
+        return self.history
+
+    @property
+    def progress(self) -> float:
+        return 1.0 if self.done else self.stream.progress
+
+    def _load(self) -> None:
+        try:
+            for field, value in self.stream:
+                if field == 'env_info':
+                    self.history = replay.Replay(env_info=value)
+                    self._ready.set()
+                elif field == 'turns':
+                    self.turns = value
+                elif field == 'steps':
+                    self.history.steps.append(value)
+                elif field == 'states':
+                    self.history.states.append(value)
+        except Exception as e:
+            self.error = e
+            print(f'Error: failed to read {self.stream.fname}: {e}')
+        if self.turns is None and self.history is not None \
+                and self.history.states:
+            # older replays do not have it
+            self.turns = self.history.states[-1].turn
+        self.done = True
+        self._ready.set()
+
+def frame_at(history: replay.Replay, t: int):
+    """
+    What ``Screen.draw_all`` shows at state ``t``: the state, the one before,
+    the step between them and the player moving next. The replay may be
+    partly loaded, the steps may be behind the states in older replays.
+    """
+    num_steps = len(history.steps)
+    if not history.states:
+        # nothing but the track yet
+        return None, None, None, None
+    state = history.states[t]
+    last_state = history.states[t - 1] if t > 0 else None
+    last_step = history.steps[t - 1] if 0 < t <= num_steps else None
+    if t < num_steps:
+        next_player = state.players[history.steps[t].player_ind]
+    else:
+        next_player = None
+    return state, last_state, last_step, next_player
+
+# time between redraws while nothing happens but loading (ms)
+IDLE_WAIT = 250
+
+# moving the view, (dx, dy)
+PAN_KEYS = {
+    pygame.K_w: (0, -1),
+    pygame.K_a: (-1, 0),
+    pygame.K_s: (0, 1),
+    pygame.K_d: (1, 0),
+}
+
+def app(loader: ReplayLoader, cell_size: int,
         visibility_radius: Optional[int]):
+    history = loader.start()
     pygame.init()
     pygame.display.set_caption('Grid race')
     screen = Screen(
@@ -268,10 +597,19 @@ def app(history: replay.Replay, cell_size: int,
     t = 0
     playdir = 0
     repeat = 0
-    last_step = None
-    max_turns = max(history.states, key=lambda s: s.turn).turn
+    # what is on the screen, nothing is drawn while it is the same
+    drawn = None
+    idle = False
     while running:
-        for event in pygame.event.get():
+        if not idle:
+            events = pygame.event.get()
+        elif loader.done:
+            # nothing changes until the next event
+            events = [pygame.event.wait()]
+        else:
+            # but the loading progress
+            events = [pygame.event.wait(IDLE_WAIT)]
+        for event in events:
             if event.type == pygame.QUIT:
                 running = False
             elif event.type == pygame.KEYDOWN:
@@ -285,34 +623,180 @@ def app(history: replay.Replay, cell_size: int,
                     else:
                         print('Error: need to supply the visibility '
                               'radius parameter to draw fog.')
+                elif event.key in (pygame.K_PLUS, pygame.K_EQUALS,
+                                   pygame.K_KP_PLUS):
+                    screen.zoom(1)
+                elif event.key in (pygame.K_MINUS, pygame.K_KP_MINUS):
+                    screen.zoom(-1)
+                elif event.key in PAN_KEYS:
+                    dx, dy = PAN_KEYS[event.key]
+                    screen.pan(dx * screen.PAN_STEP, dy * screen.PAN_STEP)
+            elif event.type == pygame.MOUSEWHEEL:
+                screen.zoom(event.y, pygame.mouse.get_pos())
+            elif event.type == pygame.MOUSEMOTION and event.buttons[0]:
+                # dragging moves the track with the mouse
+                screen.pan(-event.rel[0], -event.rel[1])
+            elif event.type == pygame.VIDEORESIZE:
+                screen.pan(0, 0)
+            elif event.type == pygame.WINDOWEXPOSED:
+                screen.invalidate()
+                drawn = None
             elif event.type == pygame.KEYUP:
                 playdir = 0
                 repeat = 0
+        # only what is loaded can be shown
+        num_states = len(history.states)
         if playdir != 0:
             repeat += 1
         if playdir == 1 and (repeat == 1
-                             or repeat > 10) and t < len(history.states) - 1:
+                             or repeat > 10) and t < num_states - 1:
             t += 1
         if playdir == -1 and (repeat == 1 or repeat > 10) and t > 0:
             t -= 1
-        if t > 0:
-            last_step = history.steps[t - 1]
-            last_state = history.states[t - 1]
-        else:
-            last_step = None
-            last_state = None
-        if t < len(history.steps):
-            next_player = history.states[t].players[history.steps[t].player_ind]
+        frame = frame_at(history, t)
+        progress = None if loader.done else loader.progress
+        key = (t, [part is None for part in frame], screen.should_draw_fog,
+               screen.view_x, screen.view_y, screen.track_cell_size,
+               screen.screen.get_size(), loader.turns,
+               progress and round(100 * progress))
+        if key != drawn:
+            pygame.display.update(
+                screen.draw_all(*frame, loader.turns, progress))
+            drawn = key
+        idle = playdir == 0
+        if not idle:
+            clock.tick(60)
+
+    pygame.quit()
+
+# The replay being exported and the screen drawing it, in every worker
+_export_history = None
+_export_screen = None
+EXPORT_FRAME_NAME = 'frame_%05d'
+
+def _init_export(replay_file: str, cell_size: int,
+                 visibility_radius: Optional[int],
+                 max_size: tuple[int, int]) -> None:
+    global _export_history, _export_screen
+    # drawn offscreen, no window is opened
+    os.environ['SDL_VIDEODRIVER'] = 'dummy'
+    # SDL would turn SIGTERM into a quit event, and the pool could not stop
+    # the worker
+    os.environ['SDL_NO_SIGNAL_HANDLERS'] = '1'
+    pygame.init()
+    if _export_history is None:
+        # not inherited from the parent process
+        _export_history = replay.deserialise(replay_file)
+    env_info = _export_history.env_info
+    _export_screen = Screen(
+        env_info,
+        Screen.fitting_cell_size(env_info, cell_size, max_size),
+        visibility_radius,
+        should_draw_fog=visibility_radius is not None,
+        max_window_size=max_size)
+
+def _export_frames(job: tuple[list[tuple[int, int]], str]) -> int:
+    # ``frames`` are (frame index, state index) pairs, ``pattern`` names the
+    # file of a frame index
+    frames, pattern = job
+    history = _export_history
+    turns = history.turns
+    if turns is None:
+        turns = history.states[-1].turn
+    for index, t in frames:
+        _export_screen.draw_all(*frame_at(history, t), turns)
+        if pattern.endswith('.gif'):
+            # quantized here, by all the workers, rather than by the one
+            # putting the animation together
+            from PIL import Image
+            surface = _export_screen.screen
+            Image.frombytes('RGB', surface.get_size(),
+                            pygame.image.tobytes(surface, 'RGB')).quantize(
+                            ).save(pattern % index)
         else:
-            next_player = None
+            pygame.image.save(_export_screen.screen, pattern % index)
+    return len(frames)
 
-        screen.draw_all(history.states[t], last_state, last_step, next_player,
-                        max_turns)
+def _gif_frames(pattern: str, frames: list[tuple[int, int]]):
+    # one frame file open at a time, there can be more than open files allowed
+    from PIL import Image
+    for index, _ in frames:
+        with Image.open(pattern % index) as image:
+            yield image.copy()
 
-        pygame.display.flip()
-        clock.tick(60)
+def export(replay_file: str,
+           output: str,
+           cell_size: int,
+           visibility_radius: Optional[int],
+           stride: int = 1,
+           max_size: tuple[int, int] = (1920, 1080),
+           fps: int = 10,
+           processes: Optional[int] = None) -> None:
+    """
+    Draw every ``stride``-th state of a replay (and the last one) without a
+    window, as PNG files in the directory ``output``, or as a GIF or MP4
+    (with ffmpeg) if ``output`` ends with .gif or .mp4. The cell size is
+    reduced until the whole track fits into ``max_size``. The frames are
+    split into contiguous runs drawn by a pool of processes.
+    """
+    global _export_history
+    extension = os.path.splitext(output)[1].lower()
+    if extension == '.mp4' and shutil.which('ffmpeg') is None:
+        print('Error: ffmpeg is needed for MP4 export. Exiting.')
+        return
+    _export_history = replay.deserialise(replay_file)
+    states = list(range(0, len(_export_history.states), stride))
+    if states[-1] != len(_export_history.states) - 1:
+        states.append(len(_export_history.states) - 1)
+    frames = list(enumerate(states))
+    if processes is None:
+        processes = os.cpu_count() or 1
+    # a few runs per process, so that they all finish at about the same time
+    num_jobs = min(len(frames), 4 * processes)
+    with tempfile.TemporaryDirectory() as tmp:
+        if extension == '.gif':
+            pattern = os.path.join(tmp, EXPORT_FRAME_NAME + '.gif')
+        elif extension == '.mp4':
+            # PNG compression would take most of the time, for files that
+            # are thrown away
+            pattern = os.path.join(tmp, EXPORT_FRAME_NAME + '.bmp')
+        else:
+            os.makedirs(output, exist_ok=True)
+            pattern = os.path.join(output, EXPORT_FRAME_NAME + '.png')
+        jobs = [(frames[len(frames) * i // num_jobs:
+                        len(frames) * (i + 1) // num_jobs], pattern)
+                for i in range(num_jobs)]
+        with multiprocessing.Pool(processes,
+                                  initializer=_init_export,
+                                  initargs=(replay_file, cell_size,
+                                            visibility_radius,
+                                            max_size)) as pool:
+            done = 0
+            for count in pool.imap_unordered(_export_frames, jobs):
+                done += count
+                print(f'\rDrawn {done} / {len(frames)} frames', end='')
+        print()
+        if extension == '.gif':
+            images = _gif_frames(pattern, frames)
+            next(images).save(output,
+                              save_all=True,
+                              append_images=images,
+                              duration=1000 // fps,
+                              loop=0)
+        elif extension == '.mp4':
+            subprocess.run([
+                'ffmpeg', '-y', '-loglevel', 'error', '-framerate',
+                str(fps), '-i', pattern, '-vf',
+                'pad=ceil(iw/2)*2:ceil(ih/2)*2', '-pix_fmt', 'yuv420p', output
+            ],
+                           check=True)
+    print(f'Saved {output}')
 
-    pygame.quit()
+def _positive_int(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f'{value} is not a positive integer')
+    return number
 
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser()
@@ -324,15 +808,52 @@ def parse_args() -> argparse.Namespace:
         '--cell_size',
         type=int,
         default=Screen.DEFAULT_TRACK_CELL_SIZE,
-        help='Size (in pixels) of the cells in the visualisation.')
+        help='Size (in pixels) of the cells in the visualisation at the '
+        'start. +/- or the mouse wheel zooms, WASD or dragging with the mouse '
+        'moves the view.')
     parser.add_argument(
         '--visibility_radius', type=int, help='Visibility radius (optional).')
+    parser.add_argument(
+        '--export',
+        type=str,
+        default=None,
+        help='Draw the replay without opening a window, into this directory '
+        'as PNG files, or into a GIF or MP4 (needs ffmpeg) file if it ends '
+        'with .gif or .mp4.')
+    parser.add_argument('--stride',
+                        type=_positive_int,
+                        default=1,
+                        help='Export every stride-th state. Default is 1.')
+    parser.add_argument(
+        '--max_size',
+        type=int,
+        nargs=2,
+        default=[1920, 1080],
+        metavar=('WIDTH', 'HEIGHT'),
+        help='Largest exported image, the cells are made smaller to fit the '
+        'track. Default is 1920 1080.')
+    parser.add_argument(
+        '--fps',
+        type=_positive_int,
+        default=10,
+        help='Frames per second of an exported animation. Default is 10.')
+    parser.add_argument(
+        '--processes',
+        type=_positive_int,
+        default=None,
+        help='Number of processes drawing the exported frames. Default is '
+        'the number of CPUs.')
     return parser.parse_args()
 
 def main():
     args = parse_args()
-    history = replay.deserialise(args.replay_file)
-    app(history, args.cell_size, args.visibility_radius)
+    if args.export is not None:
+        export(args.replay_file, args.export, args.cell_size,
+               args.visibility_radius, args.stride, tuple(args.max_size),
+               args.fps, args.processes)
+        return
+    app(ReplayLoader(args.replay_file), args.cell_size,
+        args.visibility_radius)
 
 if __name__ == "__main__":
     main()